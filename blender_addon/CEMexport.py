@@ -1,21 +1,24 @@
 
-import sys
 from itertools import chain
 
+import numpy as np
+
 import bpy
-from mathutils import Vector, Matrix
+from mathutils import Matrix
 
 from .messagebox import ShowMessageBox
+from .cem.timing import logger, phase, logTotals
+from .cem.meshopt import generateLODs, optimizeModelCache, weldVertices, calcFrameBounds
 
-from .CEM2 import (
+from .cem import (
+    createCEM,
     CEMv2,
     Header,
-    Vector3d, Vector2d,
-    Vertex,
-    Face,
+    Vector3d,
     Material,
     Matrix4x4,
-    Frame
+    Frame,
+    VertexDataPool
 )
 
 
@@ -31,211 +34,308 @@ def checkTransforms(object: bpy.types.Object):
     return True
 
 
-def calcBounds(bboxPoints: list):
-    allX = [ x[0] for x in bboxPoints ]
-    allY = [ x[1] for x in bboxPoints ]
-    allZ = [ x[2] for x in bboxPoints ]
-
-    maxV = Vector( (max(allX),max(allY),max(allZ)) )
-    minV = Vector( (min(allX),min(allY),min(allZ)) )
+def getTagPoints(collection: bpy.types.Collection) -> list[bpy.types.Object]:
+    if collection.children and collection.children[0].name.startswith("tag points"):
+        return list(collection.children[0].objects)
 
-    centerP = (maxV - minV) * 0.5 + minV
+    ShowMessageBox(
+        title="export warning",
+        message="tag point collection not found - tag points not exported"
+    )
+    return list()
 
-    return maxV, minV, centerP
+def getMaterialObjects(childCollection: bpy.types.Collection) -> list[tuple[bpy.types.Object, str, int]]:
+    """returns (object, material name, texture index) of all material objects in the right order"""
+    materialObjects = list()
 
-def getTagPoints(collection: bpy.types.Collection):
-    tagPointNames: list[str] = list()
-    tagPointsVertex: list[Vector] = list()
-
-    if collection.children[0].name.startswith("tag points"):
-        for tp in collection.children[0].objects:
-            tagPointNames.append(tp.name.split(".")[0])
-            tagPointsVertex.append(tp.location)
-    else:
+    # since Blender likes to shuffle the order around,
+    # the objects need to be sorted by their index prefix
+    for obj in childCollection.objects:
+        nameParts = obj.name.split(":")
+        if len(nameParts) != 3 or not nameParts[0].isdigit():
+            continue
+
+        matID, matName, matTexIndex = nameParts
+        if not 1 <= int(matID) <= len(childCollection.objects):
+            continue
+
+        if "BOUNDING BOX" in matName:
+            continue
+
+        matTexIndex = int(matTexIndex.split(".")[0])
+        materialObjects.append((int(matID), obj, matName, matTexIndex))
+
+    materialObjects.sort(key=lambda x: x[0])
+
+    if materialObjects:
+        try:
+            # deselect all objects - creates error, when edit mode is enabled
+            bpy.ops.object.select_all(action='DESELECT')
+        except RuntimeError:
+            # export will fail when in edit mode
+            ShowMessageBox(
+                title="export error",
+                message="ERROR: do you have edit mode enabled??",
+                icon='ERROR'
+            )
+            raise TypeError("ERROR: do you have edit mode enabled??")
+
+    for _, obj, matName, matTexIndex in materialObjects:
+        logger.debug("parsing %s %s %s", obj.name, matName, matTexIndex)
+
+        if obj.mode == "EDIT":
+            ShowMessageBox(
+                title="export error",
+                message="please disable edit mode!",
+                icon='ERROR'
+            )
+            raise TypeError("please disable edit mode!")
+
+        if not checkTransforms(obj):
+            ShowMessageBox(
+                title="export warning",
+                message="please check your rotation, scaling and location settings, it might look wrong in the game!",
+                icon='INFO'
+            )
+
+    return [x[1:] for x in materialObjects]
+
+def getMeshTopology(mesh: bpy.types.Mesh):
+    """
+    reads the triangles into a (faces, 3) array and the UVs into a (vertices, 2) array,
+    every vertex gets the UV of the last loop using it
+    """
+    numVertices = len(mesh.vertices)
+    numLoops = len(mesh.loops)
+    numPolygons = len(mesh.polygons)
+
+    loopTotals = np.empty(numPolygons, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loopTotals)
+
+    if np.any(loopTotals != 3):
         ShowMessageBox(
             title="export warning",
-            message="tag point collection not found - tag points not exported"
+            message="CEM only supports triangles, please triangulate!"
         )
+        raise TypeError("CEM only supports triangles, please triangulate!")
+
+    loopStarts = np.empty(numPolygons, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_start", loopStarts)
+    loopVertices = np.empty(numLoops, dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loopVertices)
+
+    # (faces, 3) loop indices in polygon order
+    faceLoops = loopStarts[:, None] + np.arange(3, dtype=np.int32)
+    faces = loopVertices[faceLoops]
+
+    uvs = np.zeros((numVertices, 2), dtype=np.float32)
 
-    return tagPointNames, tagPointsVertex
+    if mesh.uv_layers:
+        loopUVs = np.empty(numLoops * 2, dtype=np.float32)
+        mesh.uv_layers[0].data.foreach_get("uv", loopUVs)
+        loopUVs = loopUVs.reshape(-1, 2)
 
-def getVertexData(childCollection: bpy.types.Collection):
-    bboxPoints = list()
-    vertices: list[Vertex] = list()
+        # UV vector flip
+        uvs[faces.ravel(), 0] = loopUVs[faceLoops.ravel(), 0]
+        uvs[faces.ravel(), 1] = 1 - loopUVs[faceLoops.ravel(), 1]
+
+    return faces.astype(np.uint32), uvs
+
+def getMeshVertices(mesh: bpy.types.Mesh, vertexData: np.ndarray):
+    """reads points and normals into the first 6 columns of vertexData"""
+    numVertices = len(mesh.vertices)
+
+    if numVertices != len(vertexData):
+        raise ExportError(f"vertex count of mesh '{mesh.name}' changes between frames")
+
+    points = np.empty(numVertices * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", points)
+    vertexData[:, 0:3] = points.reshape(-1, 3)
+
+    normals = np.empty(numVertices * 3, dtype=np.float32)
+    mesh.vertex_normals.foreach_get("vector", normals)
+    vertexData[:, 3:6] = normals.reshape(-1, 3)
+
+def getTopology(materialObjects: list, depsgraph: bpy.types.Depsgraph):
+    """builds the material table, faces and UVs, which do not change between frames"""
     materials: list[Material] = list()
-    faces: list[Face] = list()
-    transformationMatrix: Matrix
+    faces: list[np.ndarray] = list()
+    uvs: list[np.ndarray] = list()
 
-    # since Blender likes to shuffle the order around,
-    # I need to search for the right object in order to keep the right order
-    for i, _ in enumerate(childCollection.objects):
-        for obj in childCollection.objects:
-            if not obj.name.startswith(f"{i+1}:"):
-                continue
-
-            matID, matName, matTexIndex = obj.name.split(":")
-            matTexIndex = int(matTexIndex.split(".")[0])
-
-            if "BOUNDING BOX" in matName:
-                continue
-            else:
-                print("parsing", obj.name, matName, matTexIndex)
-
-
-            if obj.mode == "EDIT":
-                ShowMessageBox(
-                    title="export error",
-                    message="please disable edit mode!",
-                    icon='ERROR'
-                )
-                raise TypeError("please disable edit mode!")
-
-            try:
-                # deselect all objects - creates error, when edit mode is enabled
-                bpy.ops.object.select_all(action='DESELECT')
-            except RuntimeError:
-                # export will fail when in edit mode
-                ShowMessageBox(
-                    title="export error",
-                    message="ERROR: do you have edit mode enabled??",
-                    icon='ERROR'
-                )
-                raise TypeError("ERROR: do you have edit mode enabled??")
-
-            if not checkTransforms(obj):
-                ShowMessageBox(
-                    title="export warning",
-                    message="please check your rotation, scaling and location settings, it might look wrong in the game!",
-                    icon='INFO'
-                )
-
-            bboxPoints += obj.bound_box
-            transformationMatrix = obj.matrix_world
-            vertexOffset = len(vertices)
-
-            materials.append( Material(
-                name=matName,
-                textureIndex=matTexIndex,
-                textureName="",
-                triangleSelections=[(len(faces), len(obj.data.polygons))],
-                vertexOffset=vertexOffset,
-                vertexCount=len(obj.data.vertices)
-            ) )
-
-
-            for vertex in obj.data.vertices:
-                vertices.append( Vertex(
-                    point=Vector3d(*vertex.co.to_tuple()),
-                    normal=Vector3d(*vertex.normal.to_tuple()),
-                    texture=Vector2d()
-                ) )
-
-            for polygon in obj.data.polygons:
-                face = list()
-                for li in polygon.loop_indices:
-                    vIndex = obj.data.loops[li].vertex_index
-                    uv = obj.data.uv_layers[0].data[li].uv
-
-                    vertices[vIndex + vertexOffset].texture = Vector2d(uv[0], 1 - uv[1])
-                    face.append(vIndex)
-
-                if len(face) > 3:
-                    ShowMessageBox(
-                        title="export warning",
-                        message="CEM only supports triangles, please triangulate!"
-                    )
-                    raise TypeError("CEM only supports triangles, please triangulate!")
-
-                faces.append( Face(face[0], face[1], face[2]) )
-
-    return bboxPoints, vertices, materials, faces, transformationMatrix
-
-
-def cemExport(filename: str):
+    vertexOffset = 0
+    faceOffset = 0
+
+    for obj, matName, matTexIndex in materialObjects:
+        objEval = obj.evaluated_get(depsgraph)
+        objFaces, objUVs = getMeshTopology(objEval.to_mesh())
+        objEval.to_mesh_clear()
+
+        materials.append( Material(
+            name=matName,
+            textureIndex=matTexIndex,
+            textureName="",
+            triangleSelections=[(faceOffset, len(objFaces))],
+            vertexOffset=vertexOffset,
+            vertexCount=len(objUVs)
+        ) )
+
+        faces.append(objFaces)
+        uvs.append(objUVs)
+
+        vertexOffset += len(objUVs)
+        faceOffset += len(objFaces)
+
+    faces = np.concatenate(faces) if faces else np.zeros((0, 3), dtype=np.uint32)
+    uvs = np.concatenate(uvs) if uvs else np.zeros((0, 2), dtype=np.float32)
+
+    return materials, faces, uvs
+
+def getVertexData(materialObjects: list, materials: list[Material], uvs: np.ndarray, depsgraph: bpy.types.Depsgraph):
+    """samples the animated data of all material objects at the current frame"""
+    transformationMatrix = Matrix()
+
+    vertexData = np.empty((len(uvs), 8), dtype=np.float32)
+    vertexData[:, 6:8] = uvs
+
+    for (obj, _, _), material in zip(materialObjects, materials):
+        objEval = obj.evaluated_get(depsgraph)
+
+        transformationMatrix = objEval.matrix_world.copy()
+
+        vStart = material.vertexOffset
+        vEnd = vStart + material.vertexCount
+
+        getMeshVertices(objEval.to_mesh(), vertexData[vStart:vEnd])
+        objEval.to_mesh_clear()
+
+    return vertexData, transformationMatrix
+
+
+def cemExport(filename: str, compressed: bool = False, lodLevels: int = 1, lodRatio: float = 0.5, optimizeCache: bool = False, weld: bool = True):
     print("saving", filename)
 
     try:
-        cemParts = _cemExport()
+        cemParts = _cemExport(lodLevels, lodRatio, optimizeCache, weld)
 
-        with open(filename, "wb") as f:
+        with createCEM(filename, compressed) as f, phase("serialize", f):
             for cem in cemParts:
                 cem.serialize(f)
+
+        logTotals()
     except ExportError as e:
         ShowMessageBox(title="export error", icon="ERROR", message=str(e))
         print("Export Error:", e)
 
 
-def _cemExport() -> list[CEMv2]:
+def _cemExport(lodLevels: int = 1, lodRatio: float = 0.5, optimizeCache: bool = False, weld: bool = True) -> list[CEMv2]:
     print("generating CEM")
 
     currScene = bpy.context.scene
+    currentFrame = currScene.frame_current
     mainCollection = bpy.context.scene.collection.children[0]
 
     if not mainCollection.name.startswith("M:"):
         raise ExportError("missing main collection")
 
     cemParts: list[CEMv2] = list()
+    childParts: list[tuple] = list()
+
+    # object order, materials, faces and UVs are the same for all frames
+    currScene.frame_set(currScene.frame_start)
+    depsgraph = bpy.context.evaluated_depsgraph_get()
 
     for nc, childCollection in enumerate(mainCollection.children):
         if not childCollection.name.startswith(f"{nc+1}:"):
             raise ExportError("no valid CEM structure found")
 
-        print("###", childCollection.name)
+        logger.debug("### %s", childCollection.name)
+
+        with phase("topology"):
+            materialObjects = getMaterialObjects(childCollection)
+            tagPoints = getTagPoints(childCollection)
+            materials, faces, uvs = getTopology(materialObjects, depsgraph)
 
         header = Header()
         header.name = childCollection.name.split(":")[-1]
         header.lodLevels = 1
+        header.vertices = len(uvs)
+        header.materials = len(materials)
+        header.faces = len(faces)
+        header.tagPoints = len(tagPoints)
 
+        cemParts.append(CEMv2(
+            header=header,
+            faces=[faces],
+            materials=materials,
+            frames=list(),
+            tagPoints=[tp.name.split(".")[0] for tp in tagPoints]
+        ))
+        childParts.append((materialObjects, tagPoints, uvs))
 
-        bboxPoints = list()
-        vertices: list[Vertex] = list()
-        materials: list[Material] = list()
-        faces: list[Face] = list()
-        transformationMatrix = Matrix()
-        tagPointNames: list[str] = list()
-
-
-        frames: list[Frame] = list()
-        numFrames = currScene.frame_end - currScene.frame_start + 1
-
-        for i, frame in enumerate(range(numFrames)):
-            currScene.frame_current = frame
+    # per frame only the animated data gets sampled,
+    # identical poses (e.g. rigid animations) share one vertex array
+    numFrames = currScene.frame_end - currScene.frame_start + 1
+    pools = [VertexDataPool() for _ in cemParts]
 
-            tagPointNames, tagPointVertex = getTagPoints(childCollection)
-            bboxPoints, vertices, materials, faces, transformationMatrix = getVertexData(childCollection)
-            maxV, minV, centerP = calcBounds(bboxPoints)
+    for i in range(numFrames):
+        currScene.frame_set(currScene.frame_start + i)
+        depsgraph = bpy.context.evaluated_depsgraph_get()
 
-            if i == 0:
-                header.vertices = len(vertices)
-                header.materials = len(materials)
-                header.faces = len(faces)
-                header.tagPoints = len(tagPointNames)
-                header.center = Vector3d(centerP.x, centerP.y, centerP.z)
+        for cem, pool, (materialObjects, tagPoints, uvs) in zip(cemParts, pools, childParts):
+            with phase("vertex data"):
+                vertices, transformationMatrix = getVertexData(materialObjects, cem.materials, uvs, depsgraph)
+                tagPointVertex = [tp.location.copy() for tp in tagPoints]
 
             transformationMatrixInv = transformationMatrix.inverted()
             tagPointVertex = [transformationMatrixInv @ v for v in tagPointVertex]
             transMat = Matrix4x4(*chain.from_iterable([row.to_tuple() for row in transformationMatrix.row]))
 
-            frames.append(Frame(
-                radius=(maxV - minV).length_squared,
-                vertices=vertices,
+            # bounds and radius are computed from the final vertex data below
+            cem.frames.append(Frame(
+                radius=0.0,
+                vertexData=pool.share(vertices),
                 tagPoints=[Vector3d(*x.to_tuple()) for x in tagPointVertex],
                 transformationMatrix=transMat,
-                lowerBound=Vector3d(*minV.to_tuple()),
-                upperBound=Vector3d(*maxV.to_tuple())
+                lowerBound=Vector3d(),
+                upperBound=Vector3d()
             ))
 
+    currScene.frame_set(currentFrame)
 
-        header.frames = len(frames)
+    for cem in cemParts:
+        cem.header.frames = len(cem.frames)
 
-        cemParts.append(CEMv2(
-            header=header,
-            faces=[faces],
-            materials=materials,
-            frames=frames,
-            tagPoints=tagPointNames
-        ))
-        # not too great, but ok
-        cemParts[0].header.childModels = nc
+    # duplicates from UV seams and loose vertices end up in every frame otherwise
+    if weld:
+        with phase("weld"):
+            for cem in cemParts:
+                before, after = weldVertices(cem)
+                logger.debug("%s: welded %d vertices into %d", cem.header.name, before, after)
+
+    # lower LOD levels are decimated from LOD 1 over the shared vertex buffer
+    if lodLevels > 1:
+        with phase("lods"):
+            for cem in cemParts:
+                generateLODs(cem, lodLevels, lodRatio)
+
+    # runs last, so the face order of every LOD level gets optimized
+    if optimizeCache:
+        with phase("vertex cache"):
+            for cem in cemParts:
+                before, after = optimizeModelCache(cem)
+                print(f"{cem.header.name}: vertex cache ACMR {before:.3f} -> {after:.3f}")
+
+    # after welding, so vertices which are not exported do not count
+    with phase("bounds"):
+        for cem in cemParts:
+            calcFrameBounds(cem)
+
+            if cem.frames:
+                lower, upper = cem.frames[0].lowerBound, cem.frames[0].upperBound
+                cem.header.center = Vector3d((lower.x + upper.x) / 2, (lower.y + upper.y) / 2, (lower.z + upper.z) / 2)
+
+    # not too great, but ok
+    if cemParts:
+        cemParts[0].header.childModels = len(cemParts) - 1
 
     return cemParts
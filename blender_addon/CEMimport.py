@@ -1,132 +1,470 @@
+import hashlib
 import os
+import queue
+import threading
+
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+
+import numpy as np
 
 import bpy
-from mathutils import Vector, Matrix
+from mathutils import Matrix
 
 from . import utils
+from .utils import EMPTY_SIZE
+
+from .cem import CEMv2, CEMReader, ParseCache, parseCached, vertexDigest
+from .cem.timing import phase, logTotals
+
+# lodLevel for importing all LOD levels at once
+ALL_LODS = -1
+
+# files parsed at the same time by a multi file import
+PARSER_THREADS = max(1, min(8, os.cpu_count() or 1))
+# parsed models a parser keeps ready before it waits for the import to take them
+PARSED_MODELS = 2
+# seconds a waiting parser sleeps before it checks whether the import got cancelled
+PARSER_POLL_TIMEOUT = 0.1
+
+
+def _buildMesh(mesh: bpy.types.Mesh, points: np.ndarray, faces: np.ndarray, uvs: np.ndarray):
+    """fills an empty mesh from flat buffers, faces are triangles indexing into points"""
+    numLoops = faces.size
+
+    mesh.vertices.add(len(points))
+    mesh.loops.add(numLoops)
+    mesh.polygons.add(len(faces))
+
+    mesh.vertices.foreach_set("co", np.ascontiguousarray(points, dtype=np.float32).ravel())
+    mesh.loops.foreach_set("vertex_index", faces.astype(np.int32).ravel())
+    mesh.polygons.foreach_set("loop_start", np.arange(0, numLoops, 3, dtype=np.int32))
+
+    # one UV per loop, with vector flip
+    loopUVs = uvs[faces.ravel()].astype(np.float32)
+    loopUVs[:, 1] = 1 - loopUVs[:, 1]
 
-from .CEM2 import CEMv2
+    mesh.uv_layers.new()
+    mesh.uv_layers[0].uv.foreach_set("vector", loopUVs.ravel())
 
-EMPTY_SIZE = 0.04
+    mesh.update(calc_edges=True)
 
-def cemImport(filename: str, lodLevel: int):
+
+def cemImport(filename: str, lodLevel: int, animMode: str = "SHAPE_KEYS", cache: ParseCache | None = None):
     print("loading", filename)
 
-    with open(filename, "rb") as f:
-        cem = CEMv2.parse(f)
+    # identical materials of different child models share one mesh
+    meshes = dict()
+
+    if cache is not None:
+        # a warm cache skips decoding, a cold one decodes every frame and stores them
+        for _ in importSteps(filename, map(_ModelData, parseCached(filename, cache)), lodLevel, animMode, meshes):
+            pass
+    else:
+        with CEMReader(filename) as reader:
+            for _ in importSteps(filename, map(_ModelData, reader.models), lodLevel, animMode, meshes):
+                pass
+
+    logTotals()
+
+def cemImportFiles(filenames: list[str], lodLevel: int, animMode: str = "SHAPE_KEYS", cache: ParseCache | None = None):
+    """imports multiple files, parsing all of them in parallel"""
+    parsers = startParsers(filenames, animMode, cache)
+
+    try:
+        for _ in importFilesSteps(parsers, lodLevel, animMode, block=True):
+            pass
+    finally:
+        for parser in parsers:
+            parser.cancel()
+
+    logTotals()
+
+
+def startParsers(filenames: list[str], animMode: str, cache: ParseCache | None = None) -> list["BackgroundParser"]:
+    """
+    creates a parser per file and starts the first PARSER_THREADS of them,
+    importFilesSteps starts the next one whenever a file is imported
+    """
+    parsers = [BackgroundParser(x, animMode, cache) for x in filenames]
+    for parser in parsers[:PARSER_THREADS]:
+        parser.start()
+
+    return parsers
+
+def importFilesSteps(parsers: list["BackgroundParser"], lodLevel: int, animMode: str, block: bool = False) -> Iterator[float | None]:
+    """
+    importSteps of multiple files in order, meshes with identical geometry are shared between all of them,
+    with block the steps wait for the parsers instead of yielding None
+    """
+    meshes = dict()
 
-        currScene = bpy.context.scene
+    for n, parser in enumerate(parsers):
+        print("loading", parser.filename)
+
+        # the timeline is reset by the first file and only extended by the others
+        for progress in importSteps(parser.filename, parser.models(block), lodLevel, animMode, meshes, resetTimeline=n == 0):
+            yield None if progress is None else (n + progress) / len(parsers)
+
+        # files are parsed in import order, at most PARSER_THREADS files ahead with
+        # PARSED_MODELS models each are held in memory, to keep memory usage in check
+        if n + PARSER_THREADS < len(parsers):
+            parsers[n + PARSER_THREADS].start()
+
+
+def importSteps(filename: str, models: Iterable["_ModelData | None"], lodLevel: int, animMode: str,
+                meshes: dict[bytes, bpy.types.Mesh] | None = None, resetTimeline: bool = True) -> Iterator[float | None]:
+    """
+    the import as generator, yields the progress (0 to 1) after every created object,
+    so it can be spread over multiple iterations of Blender's event loop
+
+    a None in models means the next model is not parsed yet, the steps yield None as well then,
+    meshes maps geometry hashes to already imported meshes which get reused,
+    without resetTimeline the scene frame range is only extended to fit the file
+    """
+    if meshes is None:
+        meshes = dict()
+
+    models = iter(models)
+
+    model = yield from _nextModel(models)
+    if model is None:
+        return
+
+    cem = model.cem
+
+    currScene = bpy.context.scene
+    if resetTimeline:
         currScene.frame_current = 0
         currScene.frame_start = 0
         currScene.frame_end = max(0, cem.header.frames - 1)
+    else:
+        currScene.frame_end = max(currScene.frame_end, cem.header.frames - 1)
+
+    basename = os.path.basename(filename)
 
-        basename = os.path.basename(filename)
+    if lodLevel == ALL_LODS:
+        lodLevels = list(range(cem.header.lodLevels))
+    else:
+        lodLevels = [lodLevel]
 
-        mainCollection = bpy.data.collections.new(f"M:{basename}.LOD {lodLevel}")
+    mainCollections = list()
+    for lod in lodLevels:
+        mainCollection = bpy.data.collections.new(f"M:{basename}.LOD {lod}")
         currScene.collection.children.link(mainCollection)
 
-        childIndex = 1
-        childCollection = bpy.data.collections.new(f"{childIndex}:{cem.header.name}")
-        mainCollection.children.link(childCollection)
+        # only the first level is visible, all of them overlap
+        mainCollection.hide_viewport = lod != lodLevels[0]
+        mainCollections.append(mainCollection)
 
-        _cemImport(cem, lodLevel, childCollection)
+    numModels = cem.header.childModels + 1
+    childIndex = 1
 
-        for i in range(cem.header.childModels):
-            childIndex = i + 2
-            cem = CEMv2.parse(f)
+    while model is not None:
+        # frames are only decoded when the import needs them,
+        # with multiple LOD levels they get decoded once and shared between the levels
+        if len(lodLevels) > 1:
+            model.cem.frames = list(model.cem.frames)
 
-            childCollection = bpy.data.collections.new(f"{childIndex}:{cem.header.name}")
+        for n, (lod, mainCollection) in enumerate(zip(lodLevels, mainCollections)):
+            childCollection = bpy.data.collections.new(f"{childIndex}:{model.cem.header.name}")
             mainCollection.children.link(childCollection)
 
-            _cemImport(cem, lodLevel, childCollection)
+            for done in _cemImport(model, lod, childCollection, animMode, meshes):
+                yield (childIndex - 1 + (n + done) / len(lodLevels)) / numModels
 
+        model = yield from _nextModel(models)
+        childIndex += 1
 
-def _cemImport(cem: CEMv2, lodLevel: int, childCollection: bpy.types.Collection):
 
-    bbox = utils.newEmptyCube("0:BOUNDING BOX:0")
-    childCollection.objects.link(bbox)
+def _nextModel(models: Iterator["_ModelData | None"]):
+    """returns the next model or None after the last one, yields None while waiting for it"""
+    while (model := next(models, False)) is None:
+        yield None
 
-    for i, material in enumerate(cem.materials):
+    return model or None
 
-        matName = material.name if material.name else "none"
-        objName = f"{i+1}:{matName}:{material.textureIndex}"
 
-        selectionOffset, selectionLen = material.triangleSelections[lodLevel]
-        faces = [x.toTuple() for x in cem.faces[lodLevel][selectionOffset : selectionOffset + selectionLen]]
+class BackgroundParser(threading.Thread):
+    """
+    parses the models of a file in a worker thread while the main thread builds
+    the meshes of the models parsed so far, the format code does not need bpy
+    """
 
-        matMesh = bpy.data.meshes.new(material.textureName)
-        matMesh.uv_layers.new()
+    def __init__(self, filename: str, animMode: str, cache: ParseCache | None = None):
+        super().__init__(name="CEM parser", daemon=True)
 
-        matObj = bpy.data.objects.new(objName, matMesh)
-        childCollection.objects.link(matObj)
+        self.filename = filename
+        self.animMode = animMode
+        self.cache = cache
 
-        for n, frame in enumerate(cem.frames):
+        self._queue = queue.Queue(maxsize=PARSED_MODELS)
+        self._cancelled = threading.Event()
 
-            transMatrix = Matrix(frame.transformationMatrix.toTuple())
-            bboxMin = Vector(frame.lowerBound.toTuple())
-            bboxMax = Vector(frame.upperBound.toTuple())
+    def run(self):
+        try:
+            if self.cache is not None:
+                self._parse(parseCached(self.filename, self.cache))
+            else:
+                with CEMReader(self.filename) as reader:
+                    self._parse(reader.models)
+        except Exception as e:
+            self._put(e)
+        finally:
+            self._put(None)
+
+    def _put(self, item):
+        """waits until the import takes the item or gets cancelled"""
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(item, timeout=PARSER_POLL_TIMEOUT)
+                return
+            except queue.Full:
+                pass
+
+    def _parse(self, models: list[CEMv2]):
+        for cem in models:
+            if self._cancelled.is_set():
+                return
+
+            with phase("frames"):
+                cem.frames = list(cem.frames)
+
+            model = _ModelData(cem)
+
+            # hashing the poses is the bulk of the shape key work which does not need bpy,
+            # they are also part of the geometry hash of every mesh
+            if cem.frames:
+                for material in cem.materials:
+                    model.getPoses(material.vertexOffset, material.vertexOffset + material.vertexCount)
+
+            self._put(model)
+
+    def models(self, block: bool = False) -> Iterator["_ModelData | None"]:
+        """parsed models in file order, None while the next one is not ready yet unless block is set"""
+        while True:
+            try:
+                item = self._queue.get(block)
+            except queue.Empty:
+                yield None
+                continue
+
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+
+            yield item
+
+    def cancel(self):
+        self._cancelled.set()
+
+
+@dataclass
+class _ModelData:
+    """per model data which does not depend on the LOD level"""
+    cem: CEMv2
 
-            bbox.scale = (bboxMax - bboxMin) / 2
-            bbox.location = transMatrix.translation + (bboxMin + bboxMax) / 2
-            bbox.rotation_euler = transMatrix.to_euler()
+    # per material (vertexOffset, vertexCount) the pose hash of each frame
+    poses: dict[tuple, list[bytes]] = field(default_factory=dict)
+
+    _animation: tuple = None
+
+    @property
+    def animation(self) -> tuple:
+        """frame numbers, transforms, bounding box and tag point locations of all frames"""
+        if self._animation is None:
+            self._animation = _prepareAnimation(self.cem)
+        return self._animation
 
-            vStart = material.vertexOffset
-            vEnd = vStart + material.vertexCount
-            points = [Vector(x.point.toTuple()) for x in frame.vertices[vStart:vEnd]]
+    def getPoses(self, vStart: int, vEnd: int) -> list[bytes]:
+        if (vStart, vEnd) not in self.poses:
+            self.poses[vStart, vEnd] = [vertexDigest(frame.points[vStart:vEnd]) for frame in self.cem.frames]
+        return self.poses[vStart, vEnd]
+
+
+def _decomposeTransforms(transMatrices: list[Matrix]):
+    """splits the frame transforms into (frames, 3) location, rotation and scale arrays"""
+    locations, rotations, scales = list(), list(), list()
+    euler = None
+
+    for transMatrix in transMatrices:
+        loc, rot, scale = transMatrix.decompose()
+        # keep rotations continuous between frames
+        euler = rot.to_euler("XYZ", euler) if euler else rot.to_euler("XYZ")
+
+        locations.append(loc)
+        rotations.append(euler)
+        scales.append(scale)
+
+    return np.array(locations), np.array(rotations), np.array(scales)
+
+def _setTransformKeyframes(obj: bpy.types.Object, frameNumbers: np.ndarray, locations: np.ndarray, rotations: np.ndarray, scales: np.ndarray):
+    utils.setKeyframes(obj, "location", frameNumbers, locations)
+    utils.setKeyframes(obj, "rotation_euler", frameNumbers, rotations)
+    utils.setKeyframes(obj, "scale", frameNumbers, scales)
+
+def _importShapeKeys(obj: bpy.types.Object, model: _ModelData, vStart: int, vEnd: int):
+    """
+    stores every unique pose as shape key, which is only active on the frames using it,
+    frames with the same pose as frame 0 use the basis
+    """
+    cem = model.cem
+    poses = model.getPoses(vStart, vEnd)
 
-            if n == 0:
-                matMesh.from_pydata(points, list(), faces)
-                matMesh.update()
-                #matMesh.validate(verbose=True)
+    # first frame of every pose which differs from frame 0
+    poseStarts = dict()
+    for n, pose in enumerate(poses):
+        if pose != poses[0]:
+            poseStarts.setdefault(pose, n)
 
-                uvs = [x.texture for x in frame.vertices[vStart:vEnd]]
-                # UV vector flip
-                uvs = [Vector((x.u, 1 - x.v)) for x in uvs]
+    if not poseStarts:
+        return
 
-                for p, polygon in enumerate(matMesh.polygons):
-                    for i, index in enumerate(polygon.loop_indices):
-                        matMesh.uv_layers[0].uv[index].vector = uvs[faces[p][i]]
+    obj.shape_key_add(name="frame 0", from_mix=False)
+    shapeKeys = obj.data.shape_keys
 
-                if material.name == "player color":
-                    plColorMat = bpy.data.materials.get(material.name, bpy.data.materials.new(material.name))
-                    plColorMat.diffuse_color = (0.1, 0.1, 1, 1)
-                    plColorMat.roughness = 1
-                    plColorMat.metallic = 0
+    for pose, n in poseStarts.items():
+        key = obj.shape_key_add(name=f"frame {n}", from_mix=False)
+        key.data.foreach_set("co", np.ascontiguousarray(cem.frames[n].points[vStart:vEnd], dtype=np.float32).ravel())
 
-                    matObj.data.materials.append(plColorMat)
+        # full influence on all frames with this pose, zero on the frames next to them
+        poseFrames = [x for x, p in enumerate(poses) if p == pose]
+        keyFrames = sorted({y for x in poseFrames for y in (x - 1, x, x + 1) if 0 <= y < len(poses)})
+        values = [float(poses[x] == pose) for x in keyFrames]
 
-            else:
-                for i, vertex in enumerate(matObj.data.vertices):
-                    vertex.co = points[i]
+        utils.setKeyframes(shapeKeys, f'key_blocks["{key.name}"].value', keyFrames, values)
 
-            matObj.matrix_world = transMatrix
+def _importVertexKeyframes(mesh: bpy.types.Mesh, cem: CEMv2, vStart: int, vEnd: int):
+    """writes one fcurve per vertex coordinate with all frames at once"""
+    frameNumbers = np.arange(cem.header.frames)
+    # (frames, vertices, 3)
+    points = np.stack([frame.points[vStart:vEnd] for frame in cem.frames])
 
-            if cem.header.frames > 1:
-                matObj.keyframe_insert("location", frame=n)
-                matObj.keyframe_insert("rotation_euler", frame=n)
-                matObj.keyframe_insert("scale", frame=n)
+    for i in range(points.shape[1]):
+        utils.setKeyframes(mesh, f"vertices[{i}].co", frameNumbers, points[:, i])
 
-                bbox.keyframe_insert("location", frame=n)
-                bbox.keyframe_insert("rotation_euler", frame=n)
-                bbox.keyframe_insert("scale", frame=n)
 
-                for vertex in matObj.data.vertices:
-                    vertex.keyframe_insert("co", frame=n)
+def _prepareAnimation(cem: CEMv2) -> tuple:
+    frameNumbers = np.arange(cem.header.frames)
+
+    transMatrices = [Matrix(frame.transformationMatrix.toTuple()) for frame in cem.frames]
+    locations, rotations, scales = _decomposeTransforms(transMatrices)
+
+    # bounding box
+    lowerBounds = np.array([frame.lowerBound.toTuple() for frame in cem.frames])
+    upperBounds = np.array([frame.upperBound.toTuple() for frame in cem.frames])
+
+    bboxLocations = locations + (lowerBounds + upperBounds) / 2
+    bboxScales = (upperBounds - lowerBounds) / 2
+
+    # tag points, (frames, tag points, 3) in world space
+    matrices = np.array([frame.transformationMatrix.toTuple() for frame in cem.frames])
+    tagPoints = np.array([[x.toTuple() for x in frame.tagPoints] for frame in cem.frames]).reshape(cem.header.frames, cem.header.tagPoints, 3)
+    tagPoints = tagPoints @ matrices[:, :3, :3].transpose(0, 2, 1) + matrices[:, None, :3, 3]
+
+    return frameNumbers, transMatrices, locations, rotations, scales, bboxLocations, bboxScales, tagPoints
+
+def _geometryKey(model: _ModelData, material, faces: np.ndarray, vStart: int, vEnd: int, animMode: str) -> bytes:
+    """hash of everything a material mesh is built from, including the poses of all frames"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{material.name}\0{material.textureName}\0{animMode}\0".encode())
+    digest.update(np.ascontiguousarray(faces, dtype=np.uint32).tobytes())
+    digest.update(np.ascontiguousarray(model.cem.frames[0].uvs[vStart:vEnd]).tobytes())
+
+    for pose in model.getPoses(vStart, vEnd):
+        digest.update(pose)
+
+    return digest.digest()
+
+def _cemImport(model: _ModelData, lodLevel: int, childCollection: bpy.types.Collection, animMode: str,
+               meshes: dict[bytes, bpy.types.Mesh]) -> Iterator[float]:
+    """imports one model, yields the share of the model done after every material"""
+    cem = model.cem
+
+    bbox = utils.newEmptyCube("0:BOUNDING BOX:0")
+    childCollection.objects.link(bbox)
 
-    # tag points
     pointCollection = bpy.data.collections.new("tag points")
     childCollection.children.link(pointCollection)
 
+    if not cem.frames:
+        yield 1.0
+        return
+
+    animated = cem.header.frames > 1
+    frameNumbers, transMatrices, locations, rotations, scales, bboxLocations, bboxScales, tagPoints = model.animation
+
+    bbox.location = bboxLocations[0]
+    bbox.rotation_euler = rotations[0]
+    bbox.scale = bboxScales[0]
+
+    if animated:
+        with phase("keyframing"):
+            _setTransformKeyframes(bbox, frameNumbers, bboxLocations, rotations, bboxScales)
+
+    # materials
+    for i, material in enumerate(cem.materials):
+
+        matName = material.name if material.name else "none"
+        objName = f"{i+1}:{matName}:{material.textureIndex}"
+
+        selectionOffset, selectionLen = material.triangleSelections[lodLevel]
+        faces = cem.faces[lodLevel][selectionOffset : selectionOffset + selectionLen]
+
+        vStart = material.vertexOffset
+        vEnd = vStart + material.vertexCount
+
+        # identical meshes (e.g. repeated wheels or turrets) are linked instead of copied,
+        # shape keys and vertex keyframes live on the mesh and are shared with it
+        key = _geometryKey(model, material, faces, vStart, vEnd, animMode)
+        sharedMesh = key in meshes
+
+        if sharedMesh:
+            matMesh = meshes[key]
+        else:
+            matMesh = bpy.data.meshes.new(material.textureName)
+            with phase("mesh build"):
+                _buildMesh(matMesh, cem.frames[0].points[vStart:vEnd], faces, cem.frames[0].uvs[vStart:vEnd])
+            #matMesh.validate(verbose=True)
+            meshes[key] = matMesh
+
+        matObj = bpy.data.objects.new(objName, matMesh)
+        childCollection.objects.link(matObj)
+
+        if material.name == "player color" and not sharedMesh:
+            plColorMat = bpy.data.materials.get(material.name, bpy.data.materials.new(material.name))
+            plColorMat.diffuse_color = (0.1, 0.1, 1, 1)
+            plColorMat.roughness = 1
+            plColorMat.metallic = 0
+
+            matObj.data.materials.append(plColorMat)
+
+        matObj.matrix_world = transMatrices[0]
+
+        if animated:
+            with phase("keyframing"):
+                _setTransformKeyframes(matObj, frameNumbers, locations, rotations, scales)
+
+                # a shared mesh already carries its vertex animation
+                if not sharedMesh:
+                    if animMode == "SHAPE_KEYS":
+                        _importShapeKeys(matObj, model, vStart, vEnd)
+                    else:
+                        _importVertexKeyframes(matMesh, cem, vStart, vEnd)
+
+        yield (i + 1) / (len(cem.materials) + 1)
+
+    # tag points
     for i in range(cem.header.tagPoints):
 
         tagPoint = utils.newEmpty(cem.tagPoints[i], EMPTY_SIZE)
         pointCollection.objects.link(tagPoint)
 
-        for n, frame in enumerate(cem.frames):
-            transMatrix = Matrix(frame.transformationMatrix.toTuple())
-            locVec = Vector(frame.tagPoints[i].toTuple())
+        tagPoint.location = tagPoints[0, i]
 
-            tagPoint.location = transMatrix @ locVec
+        if animated:
+            with phase("keyframing"):
+                utils.setKeyframes(tagPoint, "location", frameNumbers, tagPoints[:, i])
 
-            if cem.header.frames > 1:
-                tagPoint.keyframe_insert("location", frame=n)
+    yield 1.0
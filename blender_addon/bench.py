@@ -0,0 +1,128 @@
+"""
+Benchmarks of the CEM format code on synthetic models, without Blender or game files.
+
+usage:
+    python -m blender_addon.bench
+    python -m blender_addon.bench --cases small medium --repeat 10 --output results.json
+
+Every case times parse, lazy read, serialize, round trip and validation
+(minimum and median over --repeat runs) and measures their peak memory
+with tracemalloc. Results are written as JSON to stdout (or --output).
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from .cem import parseModels, serializeModels, CEMReader, validateBuffer
+from .cem.synthetic import generateModels
+
+CASES = {
+    "tiny": dict(vertices=100, frames=1, lodLevels=1, childModels=0, tagPoints=0, materials=1),
+    "small": dict(vertices=1000, frames=10, lodLevels=3, childModels=2, tagPoints=4, materials=2),
+    "medium": dict(vertices=5000, frames=30, lodLevels=4, childModels=4, tagPoints=8, materials=4),
+    "large": dict(vertices=10000, frames=50, lodLevels=5, childModels=4, tagPoints=16, materials=8),
+    "many frames": dict(vertices=2000, frames=300, lodLevels=1, childModels=0, tagPoints=8, materials=2),
+    "many children": dict(vertices=500, frames=10, lodLevels=2, childModels=40, tagPoints=2, materials=2),
+}
+
+
+def _measure(function, repeat: int) -> dict:
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    # numpy reports its allocations to tracemalloc as well
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return dict(min=min(times), median=statistics.median(times), peakBytes=peak)
+
+def _serialize(models) -> bytes:
+    f = io.BytesIO()
+    serializeModels(f, models)
+    return f.getvalue()
+
+def _parse(data: bytes):
+    return parseModels(io.BytesIO(data))
+
+def _lazyRead(filename: str):
+    with CEMReader(filename) as reader:
+        for cem in reader.models:
+            # touch every frame, the reader only decodes on access
+            for frame in cem.frames:
+                frame.vertexData.sum()
+
+def runCase(name: str, parameters: dict, repeat: int) -> dict:
+    models = generateModels(**parameters)
+    data = _serialize(models)
+
+    # the lazy reader maps a real file
+    fd, filename = tempfile.mkstemp(suffix=".cem")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+
+    try:
+        results = dict(
+            parse=_measure(lambda: _parse(data), repeat),
+            lazyRead=_measure(lambda: _lazyRead(filename), repeat),
+            serialize=_measure(lambda: _serialize(models), repeat),
+            roundTrip=_measure(lambda: _serialize(_parse(data)), repeat),
+            validate=_measure(lambda: validateBuffer(data), repeat),
+        )
+    finally:
+        os.remove(filename)
+
+    # a benchmark of broken code is worthless
+    assert _serialize(_parse(data)) == data, f"{name}: round trip changed the data"
+    assert not validateBuffer(data), f"{name}: generated file does not validate"
+
+    return dict(case=name, parameters=parameters, bytes=len(data), results=results)
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="cembench", description="benchmark the CEM format code on synthetic models")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES), help="cases to run, all by default")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="timed runs per operation")
+    parser.add_argument("-o", "--output", help="write the JSON results to this file instead of stdout")
+
+    args = parser.parse_args(argv)
+
+    results = list()
+    for name in args.cases:
+        print("running", name, file=sys.stderr)
+        results.append(runCase(name, CASES[name], args.repeat))
+
+    report = dict(
+        python=platform.python_version(),
+        numpy=np.__version__,
+        platform=platform.platform(),
+        repeat=args.repeat,
+        cases=results,
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
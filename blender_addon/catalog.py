@@ -0,0 +1,71 @@
+"""
+Command line tool for the SQLite catalog of CEM headers, materials and tag points.
+
+usage:
+    python -m blender_addon.catalog update cem.db Data/models
+    python -m blender_addon.catalog tag-point cem.db fire_1
+    python -m blender_addon.catalog texture cem.db u_ship_galley.tga
+    python -m blender_addon.catalog tag-points cem.db
+    python -m blender_addon.catalog textures cem.db
+
+update only reads files which changed since the last run, all other
+commands are queries on the catalog. Results are written as JSON to stdout.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from .cem.catalog import Catalog
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="cemcatalog", description="catalog of Empire Earth CEM headers, materials and tag points")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    update = commands.add_parser("update", help="add new and changed files, remove deleted ones")
+    update.add_argument("db", help="catalog database, created if it does not exist")
+    update.add_argument("paths", nargs="+", help="CEM files or directories to search for CEM files")
+
+    for command, what in (("tag-point", "tag point"), ("texture", "texture")):
+        query = commands.add_parser(command, help=f"models using a {what}, ignoring case")
+        query.add_argument("db")
+        query.add_argument("name")
+
+    for command, what in (("tag-points", "tag point"), ("textures", "texture")):
+        listing = commands.add_parser(command, help=f"every {what} with the number of models using it")
+        listing.add_argument("db")
+
+    failed = commands.add_parser("failed", help="files which could not be read")
+    failed.add_argument("db")
+
+    args = parser.parse_args(argv)
+
+    with Catalog(args.db) as catalog:
+        if args.command == "update":
+            start = time.perf_counter()
+            result = catalog.update(args.paths)
+            result["seconds"] = time.perf_counter() - start
+
+        elif args.command == "tag-point":
+            result = [dict(file=f, model=i, name=n) for f, i, n in catalog.modelsWithTagPoint(args.name)]
+        elif args.command == "texture":
+            result = [dict(file=f, model=i, name=n) for f, i, n in catalog.modelsWithTexture(args.name)]
+
+        elif args.command == "tag-points":
+            result = dict(catalog.tagPoints())
+        elif args.command == "textures":
+            result = dict(catalog.textures())
+
+        else:
+            result = dict(catalog.failedFiles())
+
+    json.dump(result, sys.stdout, indent=2)
+    print()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,490 @@
+"""
+Python wrapper class for Empire Earth CEM v2.
+Created for the Blender CEM Plugin.
+
+@date 20.10.2024 00:27
+@author zocker_160
+"""
+
+import hashlib
+
+from dataclasses import dataclass, field
+from io import BytesIO
+
+import numpy as np
+
+from .binary import *
+from .timing import logger, phase
+
+CEM_MAGIC_COMPRESSED = b"PK01"
+CEM_MAGIC = b"SSMF"
+
+# one vertex is stored as point (3f), normal (3f) and texture (2f)
+VERTEX_DTYPE = np.dtype("<f4")
+VERTEX_FIELDS = 8
+# one face is stored as 3 vertex indices
+FACE_DTYPE = np.dtype("<u4")
+
+
+@dataclass
+class Vector3d:
+    x: float = 0
+    y: float = 0
+    z: float = 0
+
+    @staticmethod
+    def parse(f: BufferedReader):
+        return Vector3d(*struct.unpack("<fff", f.read(12)))
+
+    def toTuple(self) -> tuple:
+        return (self.x, self.y, self.z)
+
+    def serialize(self, f: BufferedWriter):
+        f.write(struct.pack("<fff", *self.toTuple()))
+
+@dataclass
+class Vector2d:
+    u: float = 0
+    v: float = 0
+
+    @staticmethod
+    def parse(f: BufferedReader):
+        return Vector2d(*struct.unpack("<ff", f.read(8)))
+
+    def toTuple(self) -> tuple:
+        return (self.u, self.v)
+
+    def serialize(self, f: BufferedWriter):
+        f.write(struct.pack("<ff", *self.toTuple()))
+
+@dataclass
+class Matrix4x4:
+    m11: float
+    m12: float
+    m13: float
+    m14: float
+
+    m21: float
+    m22: float
+    m23: float
+    m24: float
+
+    m31: float
+    m32: float
+    m33: float
+    m34: float
+
+    m41: float
+    m42: float
+    m43: float
+    m44: float
+
+    @staticmethod
+    def parse(f: BufferedReader):
+        t = struct.unpack("<16f", f.read(16 * 4))
+        return Matrix4x4(*t)
+
+    def toTuple(self) -> tuple:
+        return (
+            (self.m11, self.m12, self.m13, self.m14),
+            (self.m21, self.m22, self.m23, self.m24),
+            (self.m31, self.m32, self.m33, self.m34),
+            (self.m41, self.m42, self.m43, self.m44),
+        )
+
+    def __str__(self) -> str:
+        return f"""
+        [{self.m11}, {self.m12}, {self.m13}, {self.m14}]
+        [{self.m21}, {self.m22}, {self.m23}, {self.m24}]
+        [{self.m31}, {self.m32}, {self.m33}, {self.m34}]
+        [{self.m41}, {self.m42}, {self.m43}, {self.m44}]
+        """
+
+    def serialize(self, f: BufferedWriter):
+        for row in self.toTuple():
+            f.write(struct.pack("<4f", *row))
+
+@dataclass
+class Vertex:
+    point: Vector3d
+    normal: Vector3d
+    texture: Vector2d
+
+    @staticmethod
+    def parse(f: BufferedReader):
+        return Vertex(
+            point=Vector3d.parse(f),
+            normal=Vector3d.parse(f),
+            texture=Vector2d.parse(f)
+        )
+
+    def serialize(self, f: BufferedWriter):
+        self.point.serialize(f)
+        self.normal.serialize(f)
+        self.texture.serialize(f)
+
+@dataclass
+class Face:
+    a: int
+    b: int
+    c: int
+
+    @staticmethod
+    def parse(f: BufferedReader):
+        t = struct.unpack("<III", f.read(4 * 3))
+        return Face(*t)
+
+    def toTuple(self) -> tuple:
+        return (self.a, self.b, self.c)
+
+    def serialize(self, f: BufferedWriter):
+        f.write(struct.pack("<III", *self.toTuple()))
+
+
+def parseFaces(f: BufferedReader, numFaces: int) -> np.ndarray:
+    """reads a face block into a (numFaces, 3) uint32 array"""
+    return np.frombuffer(f.read(numFaces * 3 * FACE_DTYPE.itemsize), dtype=FACE_DTYPE).reshape(numFaces, 3)
+
+def parseVertices(f: BufferedReader, numVertices: int) -> np.ndarray:
+    """reads a vertex block into a (numVertices, 8) float32 array"""
+    return np.frombuffer(f.read(numVertices * VERTEX_FIELDS * VERTEX_DTYPE.itemsize), dtype=VERTEX_DTYPE).reshape(numVertices, VERTEX_FIELDS)
+
+def vertexDigest(data: np.ndarray) -> bytes:
+    """hash of a vertex block (or a slice of it), used to find identical poses"""
+    return hashlib.blake2b(np.ascontiguousarray(data)).digest()
+
+class VertexDataPool:
+    """
+    hands out one shared array for identical vertex blocks,
+    so rigid animations only keep one copy per unique pose
+    """
+
+    def __init__(self):
+        self._arrays: dict[bytes, np.ndarray] = dict()
+
+    def __len__(self) -> int:
+        return len(self._arrays)
+
+    def share(self, vertexData: np.ndarray) -> np.ndarray:
+        digest = vertexDigest(vertexData)
+        shared = self._arrays.setdefault(digest, vertexData)
+
+        if shared is not vertexData and not np.array_equal(shared, vertexData):
+            # hash collision, keep the frame's own copy
+            return vertexData
+
+        return shared
+
+@dataclass
+class Header:
+    version: float = 2
+
+    faces: int = 0
+    vertices: int = 0
+    tagPoints: int = 0
+    materials: int = 0
+    frames: int = 0
+
+    childModels: int = 0
+    lodLevels: int = 1
+
+    name: str = "Scene Root"
+    center: Vector3d = field(default_factory=Vector3d)
+
+    @staticmethod
+    def parse(f: BufferedReader):
+        vMaj = readShort(f)
+        vMin = readShort(f)
+
+        return Header(
+            version=vMaj + (vMin / 10),
+            faces=readInt(f),
+            vertices=readInt(f),
+            tagPoints=readInt(f),
+            materials=readInt(f),
+            frames=readInt(f),
+            childModels=readInt(f),
+            lodLevels=readInt(f),
+            name=readString(f),
+            center=Vector3d.parse(f)
+        )
+
+    def serialize(self, f: BufferedWriter):
+        vMaj = int(self.version)
+        vMin = int((self.version - vMaj) * 10)
+
+        writeShort(f, vMaj)
+        writeShort(f, vMin)
+        writeInt(f, self.faces)
+        writeInt(f, self.vertices)
+        writeInt(f, self.tagPoints)
+        writeInt(f, self.materials)
+        writeInt(f, self.frames)
+        writeInt(f, self.childModels)
+        writeInt(f, self.lodLevels)
+        writeString(f, self.name)
+        self.center.serialize(f)
+
+@dataclass
+class Material:
+    name: str
+    textureIndex: int
+
+    triangleSelections: list[tuple[int]]
+
+    vertexOffset: int
+    vertexCount: int
+
+    textureName: int
+
+    @staticmethod
+    def parse(f: BufferedReader, lodLevels: int):
+        return Material(
+            name=readString(f),
+            textureIndex=readInt(f),
+            triangleSelections=[struct.unpack("<II", f.read(8)) for _ in range(lodLevels)], # FIXME
+            vertexOffset=readInt(f),
+            vertexCount=readInt(f),
+            textureName=readString(f)
+        )
+
+    def serialize(self, f: BufferedWriter):
+        writeString(f, self.name)
+        writeInt(f, self.textureIndex)
+        for selection in self.triangleSelections:
+            f.write(struct.pack("<II", *selection))
+        writeInt(f, self.vertexOffset)
+        writeInt(f, self.vertexCount)
+        writeString(f, self.textureName)
+
+@dataclass
+class Frame:
+    radius: float
+
+    # (header.vertices, 8) float32 array: point xyz, normal xyz, texture uv
+    vertexData: np.ndarray
+    tagPoints: list[Vector3d]
+
+    transformationMatrix: Matrix4x4
+
+    lowerBound: Vector3d
+    upperBound: Vector3d
+
+    @property
+    def points(self) -> np.ndarray:
+        return self.vertexData[:, 0:3]
+
+    @property
+    def normals(self) -> np.ndarray:
+        return self.vertexData[:, 3:6]
+
+    @property
+    def uvs(self) -> np.ndarray:
+        return self.vertexData[:, 6:8]
+
+    @property
+    def vertices(self) -> list[Vertex]:
+        """compatibility accessor, builds Vertex objects from vertexData"""
+        return [
+            Vertex(
+                point=Vector3d(*v[0:3]),
+                normal=Vector3d(*v[3:6]),
+                texture=Vector2d(*v[6:8])
+            ) for v in self.vertexData.tolist()
+        ]
+
+    @staticmethod
+    def size(header: Header) -> int:
+        """size of one serialized frame in bytes"""
+        return 4 + header.vertices * VERTEX_FIELDS * VERTEX_DTYPE.itemsize + header.tagPoints * 12 + 16 * 4 + 2 * 12
+
+    @staticmethod
+    def fromBuffer(buffer, offset: int, header: Header):
+        """decodes the frame at offset, vertexData is a zero-copy view into buffer"""
+        radius, = struct.unpack_from("<f", buffer, offset)
+        offset += 4
+
+        vertexData = np.frombuffer(buffer, dtype=VERTEX_DTYPE, count=header.vertices * VERTEX_FIELDS, offset=offset)
+        offset += vertexData.nbytes
+
+        tagPoints = struct.unpack_from(f"<{header.tagPoints * 3}f", buffer, offset)
+        offset += header.tagPoints * 12
+
+        trailer = struct.unpack_from("<22f", buffer, offset)
+
+        return Frame(
+            radius=radius,
+            vertexData=vertexData.reshape(header.vertices, VERTEX_FIELDS),
+            tagPoints=[Vector3d(*tagPoints[i:i+3]) for i in range(0, len(tagPoints), 3)],
+            transformationMatrix=Matrix4x4(*trailer[0:16]),
+            lowerBound=Vector3d(*trailer[16:19]),
+            upperBound=Vector3d(*trailer[19:22])
+        )
+
+    @staticmethod
+    def parse(f: BufferedReader, header: Header):
+        return Frame(
+            radius=readFloat(f),
+            vertexData=parseVertices(f, header.vertices),
+            tagPoints=[Vector3d.parse(f) for _ in range(header.tagPoints)],
+            transformationMatrix=Matrix4x4.parse(f),
+            lowerBound=Vector3d.parse(f),
+            upperBound=Vector3d.parse(f)
+        )
+
+    def serialize(self, f: BufferedWriter):
+        writeFloat(f, self.radius)
+        f.write(np.ascontiguousarray(self.vertexData, dtype=VERTEX_DTYPE).tobytes())
+        for tagPoint in self.tagPoints:
+            tagPoint.serialize(f)
+        self.transformationMatrix.serialize(f)
+        self.lowerBound.serialize(f)
+        self.upperBound.serialize(f)
+
+@dataclass
+class CEMv2:
+    
+    header: Header
+    
+    # one (numFaces, 3) uint32 array per LOD level
+    faces: list[np.ndarray]
+    materials: list[Material]
+    frames: list[Frame]
+
+    tagPoints: list[str]
+
+    @staticmethod
+    def parseTables(f: BufferedReader):
+        """parses everything except the frames, f is left at the start of the first frame"""
+        # header
+        with phase("header", f):
+            magic = f.read(4)
+            assert magic != CEM_MAGIC_COMPRESSED, "CEM file is compressed, open it with openCEM"
+            assert magic == CEM_MAGIC, "invalid CEM magic"
+
+            header = Header.parse(f)
+            assert header.version == 2, "only CEM v2 is supported"
+
+        logger.debug("%s", header)
+
+        # faces
+        faces = list()
+        with phase("faces", f):
+            for i in range(header.lodLevels):
+                numFaces = readInt(f)
+                faces.append(parseFaces(f, numFaces))
+
+        # materials
+        materials = list()
+        with phase("materials", f):
+            for _ in range(header.materials):
+                materials.append(Material.parse(f, header.lodLevels))
+
+        # tag points
+        tagPoints = list()
+        with phase("tag points", f):
+            for _ in range(header.tagPoints):
+                tagPoints.append(readString(f))
+
+        assert len(materials) == header.materials
+        assert len(tagPoints) == header.tagPoints
+
+        return CEMv2(
+            header=header,
+            faces=faces,
+            materials=materials,
+            frames=list(),
+            tagPoints=tagPoints
+        )
+
+    @staticmethod
+    def parse(f: BufferedReader):
+        cem = CEMv2.parseTables(f)
+
+        # frames, identical vertex blocks share one array
+        pool = VertexDataPool()
+
+        with phase("frames", f):
+            for _ in range(cem.header.frames):
+                frame = Frame.parse(f, cem.header)
+                frame.vertexData = pool.share(frame.vertexData)
+                cem.frames.append(frame)
+
+        logger.debug("%d unique poses in %d frames", len(pool), cem.header.frames)
+
+        assert len(cem.frames) == cem.header.frames
+
+        return cem
+
+    def toBytes(self) -> bytearray:
+        """
+        serializes the model into a single preallocated buffer,
+        faces and frames are packed with numpy instead of one write per value
+        """
+        # header, materials and tag point names are small and variable sized
+        head = BytesIO()
+        head.write(CEM_MAGIC)
+        self.header.serialize(head)
+
+        tables = BytesIO()
+        for i in range(self.header.materials):
+            self.materials[i].serialize(tables)
+        for i in range(self.header.tagPoints):
+            writeString(tables, self.tagPoints[i])
+
+        lodFaces = [np.asarray(self.faces[i]).reshape(-1, 3) for i in range(self.header.lodLevels)]
+
+        frameSize = Frame.size(self.header)
+        size = head.tell() + sum(4 + x.size * FACE_DTYPE.itemsize for x in lodFaces) + tables.tell() + self.header.frames * frameSize
+
+        buffer = bytearray(size)
+        offset = head.tell()
+        buffer[0:offset] = head.getbuffer()
+
+        for faces in lodFaces:
+            struct.pack_into("<I", buffer, offset, len(faces))
+            offset += 4
+
+            np.frombuffer(buffer, dtype=FACE_DTYPE, count=faces.size, offset=offset)[:] = faces.ravel()
+            offset += faces.size * FACE_DTYPE.itemsize
+
+        buffer[offset : offset + tables.tell()] = tables.getbuffer()
+        offset += tables.tell()
+
+        # every frame is one row of float32 values
+        frameData = np.frombuffer(buffer, dtype=VERTEX_DTYPE, count=self.header.frames * frameSize // 4, offset=offset)
+        frameData = frameData.reshape(self.header.frames, frameSize // 4)
+
+        vertexEnd = 1 + self.header.vertices * VERTEX_FIELDS
+        tagPointEnd = vertexEnd + self.header.tagPoints * 3
+
+        for i in range(self.header.frames):
+            frame = self.frames[i]
+            row = frameData[i]
+
+            row[0] = frame.radius
+            row[1:vertexEnd] = np.asarray(frame.vertexData).ravel()
+            row[vertexEnd:tagPointEnd] = [x for tagPoint in frame.tagPoints for x in tagPoint.toTuple()]
+            row[tagPointEnd:] = (
+                *(x for r in frame.transformationMatrix.toTuple() for x in r),
+                *frame.lowerBound.toTuple(),
+                *frame.upperBound.toTuple()
+            )
+
+        return buffer
+
+    def serialize(self, f: BufferedWriter):
+        f.write(self.toBytes())
+
+
+def parseModels(f: BufferedReader) -> list[CEMv2]:
+    """parses the main model and all of its child models"""
+    models = [CEMv2.parse(f)]
+    for _ in range(models[0].header.childModels):
+        models.append(CEMv2.parse(f))
+
+    return models
+
+def serializeModels(f: BufferedWriter, models: list[CEMv2]):
+    for cem in models:
+        cem.serialize(f)
@@ -0,0 +1,30 @@
+"""
+Empire Earth CEM file format, independent of Blender.
+
+Only depends on numpy, so it can be used by command line tools and
+worker processes without a Blender runtime.
+"""
+
+from .CEM2 import (
+    CEM_MAGIC,
+    CEM_MAGIC_COMPRESSED,
+    CEMv2,
+    Header,
+    Vector3d, Vector2d,
+    Vertex,
+    Face,
+    Material,
+    Matrix4x4,
+    Frame,
+    vertexDigest,
+    VertexDataPool,
+    parseModels,
+    serializeModels
+)
+from .compression import openCEM, createCEM
+from .reader import CEMReader
+from .cache import ParseCache, parseCached
+from .timing import enableTiming, getTotals, logTotals
+from .index import ModelIndexEntry, indexChildModels, scanModel, scanFile, findFiles, readChildModel, replaceChildModel
+from .validate import ValidationIssue, validateBuffer, validateFile
+from .catalog import Catalog
@@ -0,0 +1,39 @@
+## data loading
+
+import struct
+from io import BufferedReader, BufferedWriter
+
+def readInt(f: BufferedReader) -> int:
+    return int.from_bytes(f.read(4), byteorder="little", signed=False)
+def readShort(f: BufferedReader) -> int:
+    return int.from_bytes(f.read(2), byteorder="little", signed=False)
+def readByte(f: BufferedReader) -> int:
+    return int.from_bytes(f.read(1), byteorder="little", signed=False)
+def readFloat(f: BufferedReader) -> float:
+    return struct.unpack("<f", f.read(4))[0]
+
+def readString(f: BufferedReader) -> str:
+    length = readInt(f)
+    return f.read(length).strip(b"\0").decode("iso8859-15")
+
+def writeInt(f: BufferedWriter, value: int) -> int:
+    return f.write(value.to_bytes(4, byteorder="little", signed=False))
+def writeShort(f: BufferedWriter, value: int) -> int:
+    return f.write(value.to_bytes(2, byteorder="little", signed=False))
+def writeByte(f: BufferedWriter, value: int) -> int:
+    return f.write(value.to_bytes(1, byteorder="little", signed=False))
+def writeFloat(f: BufferedWriter, value: float) -> int:
+    return f.write(struct.pack("<f", value))
+
+def writeString(f: BufferedWriter, value: str) -> int:
+    value = value.encode("iso8859-15")
+    value = checkNullTerminator(value)
+
+    writeInt(f, len(value))
+    return f.write(value)
+
+
+def checkNullTerminator(data: bytes) -> bytes:
+    if not data.endswith(b"\0"):
+        data += b"\0"
+    return data
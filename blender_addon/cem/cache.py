@@ -0,0 +1,230 @@
+"""
+On-disk cache of parsed CEM files.
+
+Decoded models are stored as .npz files keyed by file size, mtime and
+content hash, so re-importing an unchanged file skips decoding entirely.
+The cache directory is capped in size, the least recently used entries
+get evicted first.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+
+from dataclasses import asdict
+
+import numpy as np
+
+from .CEM2 import CEMv2, Header, Vector3d, Material, Matrix4x4, Frame, VertexDataPool, FACE_DTYPE, VERTEX_DTYPE
+from .reader import CEMReader
+from .timing import logger, phase
+
+CACHE_DIR = os.path.join(tempfile.gettempdir(), "cem_cache")
+# 1 GiB
+CACHE_SIZE = 1 << 30
+
+HASH_CHUNK_SIZE = 1 << 20
+# bumped whenever the layout of the cache files changes
+CACHE_VERSION = 1
+
+
+class ParseCache:
+    """LRU cache of parsed CEM files, maxBytes caps the size of the cache directory"""
+
+    def __init__(self, directory: str = CACHE_DIR, maxBytes: int = CACHE_SIZE):
+        self.directory = directory
+        self.maxBytes = maxBytes
+
+    def key(self, filename: str) -> str:
+        stat = os.stat(filename)
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{CACHE_VERSION}:{stat.st_size}:{stat.st_mtime_ns}:".encode())
+
+        with open(filename, "rb") as f:
+            while chunk := f.read(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def load(self, filename: str, key: str | None = None) -> list[CEMv2] | None:
+        """returns the cached models of filename or None on a cache miss, key skips hashing the file"""
+        path = self._path(key or self.key(filename))
+
+        try:
+            with np.load(path) as data:
+                models = _unpackModels(data)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning("dropping broken cache entry %s: %s", path, e)
+            _remove(path)
+            return None
+
+        # mtime is the LRU clock, another parser thread may have evicted the entry meanwhile
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        return models
+
+    def store(self, filename: str, models: list[CEMv2], key: str | None = None):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key or self.key(filename))
+
+        # written under a temporary name, so a concurrent load never sees half a file
+        fd, tmpPath = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **_packModels(models))
+            os.replace(tmpPath, path)
+        except BaseException:
+            _remove(tmpPath)
+            raise
+
+        self.evict()
+
+    def evict(self):
+        """removes least recently used entries until the cache fits into maxBytes"""
+        entries = list()
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".npz"):
+                # entries can be removed by other threads sharing the cache
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        total = sum(x[1] for x in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            _remove(path)
+            total -= size
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".npz"):
+                    _remove(entry.path)
+
+
+def parseCached(filename: str, cache: ParseCache | None = None) -> list[CEMv2]:
+    """
+    parses all models of filename with every frame decoded,
+    going through the cache if one is given
+    """
+    if cache is not None:
+        with phase("cache lookup"):
+            # hashing reads the whole file, so it is done once for lookup and store
+            key = cache.key(filename)
+            models = cache.load(filename, key)
+
+        if models is not None:
+            logger.debug("cache hit for %s", filename)
+            return models
+
+    with CEMReader(filename) as reader:
+        models = list(reader.models)
+        with phase("frames"):
+            for cem in models:
+                # identical vertex blocks are stored once in the cache
+                pool = VertexDataPool()
+                cem.frames = list(cem.frames)
+                for frame in cem.frames:
+                    frame.vertexData = pool.share(frame.vertexData)
+
+    if cache is not None:
+        with phase("cache store"):
+            cache.store(filename, models, key)
+
+    return models
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+## npz layout
+
+def _packModels(models: list[CEMv2]) -> dict[str, np.ndarray]:
+    """
+    all tables go into one JSON document, the arrays are stored per model;
+    frames sharing a vertex block also share it in the cache
+    """
+    arrays = dict()
+    meta = list()
+
+    for i, cem in enumerate(models):
+        blocks = dict()
+        frameBlocks = [blocks.setdefault(id(x.vertexData), (len(blocks), x.vertexData))[0] for x in cem.frames]
+
+        vertexData = [x[1] for x in blocks.values()]
+        arrays[f"{i}.vertexData"] = np.stack(vertexData) if vertexData else np.zeros((0, cem.header.vertices, 8), dtype=VERTEX_DTYPE)
+        arrays[f"{i}.frameBlocks"] = np.asarray(frameBlocks, dtype=np.uint32)
+
+        # radius, tag points, matrix and bounds of every frame
+        arrays[f"{i}.frameFloats"] = np.asarray([
+            [x.radius]
+            + [c for tp in x.tagPoints for c in tp.toTuple()]
+            + [c for row in x.transformationMatrix.toTuple() for c in row]
+            + list(x.lowerBound.toTuple()) + list(x.upperBound.toTuple())
+            for x in cem.frames
+        ], dtype=np.float32).reshape(len(cem.frames), -1)
+
+        for level, faces in enumerate(cem.faces):
+            arrays[f"{i}.faces.{level}"] = np.asarray(faces, dtype=FACE_DTYPE).reshape(-1, 3)
+
+        meta.append({
+            "header": asdict(cem.header),
+            "materials": [asdict(x) for x in cem.materials],
+            "tagPoints": cem.tagPoints,
+        })
+
+    arrays["meta"] = np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)
+
+    return arrays
+
+def _unpackModels(data) -> list[CEMv2]:
+    models = list()
+
+    for i, meta in enumerate(json.loads(data["meta"].tobytes())):
+        header = Header(**meta["header"])
+        header.center = Vector3d(**meta["header"]["center"])
+
+        materials = [Material(**x) for x in meta["materials"]]
+        for material in materials:
+            material.triangleSelections = [tuple(x) for x in material.triangleSelections]
+
+        vertexData = data[f"{i}.vertexData"]
+        frameFloats = data[f"{i}.frameFloats"].tolist()
+        t = header.tagPoints * 3
+
+        frames = [
+            Frame(
+                radius=x[0],
+                vertexData=vertexData[block],
+                tagPoints=[Vector3d(*x[j:j+3]) for j in range(1, 1 + t, 3)],
+                transformationMatrix=Matrix4x4(*x[1 + t : 17 + t]),
+                lowerBound=Vector3d(*x[17 + t : 20 + t]),
+                upperBound=Vector3d(*x[20 + t : 23 + t])
+            ) for x, block in zip(frameFloats, data[f"{i}.frameBlocks"].tolist())
+        ]
+
+        models.append(CEMv2(
+            header=header,
+            faces=[data[f"{i}.faces.{level}"] for level in range(header.lodLevels)],
+            materials=materials,
+            frames=frames,
+            tagPoints=meta["tagPoints"]
+        ))
+
+    return models
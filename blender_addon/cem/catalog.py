@@ -0,0 +1,200 @@
+"""
+SQLite catalog of the headers, materials, textures and tag points of CEM files.
+
+Only the header and tables of every model are read, faces and frames
+are skipped. Updates are incremental: files with unchanged size and mtime
+are skipped, files which disappeared are removed from the catalog.
+"""
+
+import os
+import sqlite3
+
+from .index import scanFile, findFiles
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS models (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    model_index INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    version REAL NOT NULL,
+    faces INTEGER NOT NULL,
+    vertices INTEGER NOT NULL,
+    tag_points INTEGER NOT NULL,
+    materials INTEGER NOT NULL,
+    frames INTEGER NOT NULL,
+    child_models INTEGER NOT NULL,
+    lod_levels INTEGER NOT NULL,
+    center_x REAL NOT NULL,
+    center_y REAL NOT NULL,
+    center_z REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS materials (
+    model_id INTEGER NOT NULL REFERENCES models(id) ON DELETE CASCADE,
+    material_index INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    texture_index INTEGER NOT NULL,
+    texture_name TEXT NOT NULL,
+    vertex_offset INTEGER NOT NULL,
+    vertex_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tag_points (
+    model_id INTEGER NOT NULL REFERENCES models(id) ON DELETE CASCADE,
+    tag_point_index INTEGER NOT NULL,
+    name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS models_file ON models(file_id);
+CREATE INDEX IF NOT EXISTS models_name ON models(name);
+CREATE INDEX IF NOT EXISTS materials_model ON materials(model_id);
+CREATE INDEX IF NOT EXISTS materials_texture ON materials(texture_name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS tag_points_model ON tag_points(model_id);
+CREATE INDEX IF NOT EXISTS tag_points_name ON tag_points(name COLLATE NOCASE);
+"""
+
+
+class Catalog:
+
+    def __init__(self, path: str):
+        self.path = path
+
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    ## updating
+
+    def update(self, paths: list[str]) -> dict[str, int]:
+        """
+        (re)indexes all CEM files found in paths, files whose size and mtime did not change are skipped;
+        returns the number of added, updated, unchanged, removed and failed files
+        """
+        stats = dict(added=0, updated=0, unchanged=0, removed=0, failed=0)
+
+        known = {
+            path: (fileId, size, mtime)
+            for fileId, path, size, mtime in self.db.execute("SELECT id, path, size, mtime FROM files")
+        }
+        seen = set()
+
+        with self.db:
+            for filename, _ in findFiles(paths):
+                filename = os.path.abspath(filename)
+                seen.add(filename)
+
+                stat = os.stat(filename)
+                entry = known.get(filename)
+
+                if entry and entry[1:] == (stat.st_size, stat.st_mtime_ns):
+                    stats["unchanged"] += 1
+                    continue
+
+                if entry:
+                    self.db.execute("DELETE FROM files WHERE id = ?", (entry[0],))
+
+                if self._addFile(filename, stat):
+                    stats["updated" if entry else "added"] += 1
+                else:
+                    stats["failed"] += 1
+
+            # files below the scanned directories which do not exist anymore
+            roots = [os.path.abspath(x) for x in paths]
+            for path, (fileId, _, _) in known.items():
+                if path not in seen and any(_isBelow(path, root) for root in roots):
+                    self.db.execute("DELETE FROM files WHERE id = ?", (fileId,))
+                    stats["removed"] += 1
+
+        return stats
+
+    def _addFile(self, filename: str, stat: os.stat_result) -> bool:
+        try:
+            entries = scanFile(filename)
+            error = None
+        except Exception as e:
+            entries = list()
+            error = f"{type(e).__name__}: {e}"
+
+        fileId = self.db.execute(
+            "INSERT INTO files (path, size, mtime, error) VALUES (?, ?, ?, ?)",
+            (filename, stat.st_size, stat.st_mtime_ns, error)
+        ).lastrowid
+
+        for entry in entries:
+            header = entry.header
+            modelId = self.db.execute(
+                """INSERT INTO models (file_id, model_index, name, version, faces, vertices, tag_points, materials,
+                                       frames, child_models, lod_levels, center_x, center_y, center_z)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (fileId, entry.index, header.name, header.version, header.faces, header.vertices, header.tagPoints,
+                 header.materials, header.frames, header.childModels, header.lodLevels, *header.center.toTuple())
+            ).lastrowid
+
+            self.db.executemany(
+                """INSERT INTO materials (model_id, material_index, name, texture_index, texture_name, vertex_offset, vertex_count)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                [(modelId, i, x.name, x.textureIndex, x.textureName, x.vertexOffset, x.vertexCount) for i, x in enumerate(entry.materials)]
+            )
+            self.db.executemany(
+                "INSERT INTO tag_points (model_id, tag_point_index, name) VALUES (?, ?, ?)",
+                [(modelId, i, x) for i, x in enumerate(entry.tagPoints)]
+            )
+
+        return error is None
+
+    ## queries
+
+    def modelsWithTagPoint(self, name: str) -> list[tuple[str, int, str]]:
+        """(file, model index, model name) of all models with the tag point, ignoring case"""
+        return self.db.execute(
+            """SELECT DISTINCT files.path, models.model_index, models.name FROM tag_points
+               JOIN models ON models.id = tag_points.model_id
+               JOIN files ON files.id = models.file_id
+               WHERE tag_points.name = ? COLLATE NOCASE
+               ORDER BY files.path, models.model_index""",
+            (name,)
+        ).fetchall()
+
+    def modelsWithTexture(self, name: str) -> list[tuple[str, int, str]]:
+        """(file, model index, model name) of all models using the texture, ignoring case"""
+        return self.db.execute(
+            """SELECT DISTINCT files.path, models.model_index, models.name FROM materials
+               JOIN models ON models.id = materials.model_id
+               JOIN files ON files.id = models.file_id
+               WHERE materials.texture_name = ? COLLATE NOCASE
+               ORDER BY files.path, models.model_index""",
+            (name,)
+        ).fetchall()
+
+    def tagPoints(self) -> list[tuple[str, int]]:
+        """all tag point names with the number of models using them"""
+        return self.db.execute(
+            "SELECT name, COUNT(DISTINCT model_id) FROM tag_points GROUP BY name ORDER BY name"
+        ).fetchall()
+
+    def textures(self) -> list[tuple[str, int]]:
+        """all texture names with the number of models using them"""
+        return self.db.execute(
+            "SELECT texture_name, COUNT(DISTINCT model_id) FROM materials GROUP BY texture_name ORDER BY texture_name"
+        ).fetchall()
+
+    def failedFiles(self) -> list[tuple[str, str]]:
+        return self.db.execute("SELECT path, error FROM files WHERE error IS NOT NULL ORDER BY path").fetchall()
+
+
+def _isBelow(path: str, root: str) -> bool:
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
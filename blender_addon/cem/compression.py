@@ -0,0 +1,129 @@
+"""
+Experimental support for compressed (PK01) CEM files.
+
+The layout is assumed to be the PK01 magic followed by the size of the
+uncompressed data (uint32) and a zlib stream of the uncompressed CEM.
+It has not been verified against the compressed files shipped with the
+game yet, files which do not match it raise a ValueError.
+
+Data is decoded in chunks while it is read, so the file is never held
+in memory twice.
+"""
+
+import io
+import zlib
+
+from .binary import readInt, writeInt
+from .CEM2 import CEM_MAGIC_COMPRESSED
+
+CHUNK_SIZE = 64 * 1024
+
+
+class PK01Reader(io.RawIOBase):
+    """decompresses a PK01 stream, f has to be positioned right after the magic"""
+
+    def __init__(self, f: io.BufferedReader):
+        self._f = f
+        self._decompressor = zlib.decompressobj()
+        self._position = 0
+
+        self.size = readInt(f)
+
+    def readable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def readinto(self, b) -> int:
+        if len(b) == 0:
+            return 0
+
+        data = b""
+        while not data:
+            if self._decompressor.unconsumed_tail:
+                data = self._decompress(self._decompressor.unconsumed_tail, len(b))
+            elif self._decompressor.eof:
+                if self._position != self.size:
+                    raise ValueError(f"PK01 stream holds {self._position} bytes, its header says {self.size}")
+                return 0
+            else:
+                chunk = self._f.read(CHUNK_SIZE)
+                if not chunk:
+                    raise EOFError("PK01 stream is truncated")
+                data = self._decompress(chunk, len(b))
+
+        b[:len(data)] = data
+        self._position += len(data)
+
+        return len(data)
+
+    def _decompress(self, data: bytes, maxLength: int) -> bytes:
+        try:
+            return self._decompressor.decompress(data, maxLength)
+        except zlib.error as e:
+            raise ValueError(f"PK01 data is not a zlib stream, the file does not match the assumed layout ({e})") from e
+
+    def close(self):
+        if not self.closed:
+            self._f.close()
+        super().close()
+
+
+class PK01Writer(io.RawIOBase):
+    """compresses everything written to it into a PK01 stream"""
+
+    def __init__(self, f: io.BufferedWriter, level: int = zlib.Z_BEST_COMPRESSION):
+        self._f = f
+        self._compressor = zlib.compressobj(level)
+        self._size = 0
+
+        f.write(CEM_MAGIC_COMPRESSED)
+        # uncompressed size gets patched in on close
+        self._sizeOffset = f.tell()
+        writeInt(f, 0)
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._size
+
+    def write(self, b) -> int:
+        length = memoryview(b).nbytes
+        self._f.write(self._compressor.compress(b))
+        self._size += length
+
+        return length
+
+    def close(self):
+        if not self.closed:
+            self._f.write(self._compressor.flush())
+
+            end = self._f.tell()
+            self._f.seek(self._sizeOffset)
+            writeInt(self._f, self._size)
+            self._f.seek(end)
+
+            self._f.close()
+        super().close()
+
+
+def openCEM(filename: str) -> io.BufferedReader:
+    """opens a CEM file for reading, PK01 files are decompressed while reading"""
+    f = open(filename, "rb")
+
+    if f.peek(4)[:4] != CEM_MAGIC_COMPRESSED:
+        return f
+
+    f.read(4)
+    return io.BufferedReader(PK01Reader(f), CHUNK_SIZE)
+
+def createCEM(filename: str, compressed: bool = False) -> io.BufferedWriter:
+    """creates a CEM file for writing, optionally as (experimental) compressed PK01 file"""
+    f = open(filename, "wb")
+
+    if not compressed:
+        return f
+
+    return io.BufferedWriter(PK01Writer(f), CHUNK_SIZE)
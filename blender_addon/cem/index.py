@@ -0,0 +1,174 @@
+"""
+Offset index of the main model and all child models in a CEM file.
+
+The scan only reads counts and strings (and optionally the material and
+tag point tables), face and frame blocks are skipped using their known
+record sizes. With the index a single child model can be
+read, exported or replaced with a seek instead of decoding every model
+in front of it.
+"""
+
+import os
+
+from dataclasses import dataclass, field
+from io import BufferedReader, BufferedWriter, UnsupportedOperation
+
+from .binary import readInt, readString
+from .CEM2 import CEMv2, Frame, Header, Material, CEM_MAGIC, CEM_MAGIC_COMPRESSED
+from .compression import openCEM
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class ModelIndexEntry:
+    # 0 is the main model, child models start at 1
+    index: int
+    name: str
+
+    offset: int
+    size: int
+
+    header: Header
+
+    # only filled by a scan with tables
+    materials: list[Material] = field(default_factory=list)
+    tagPoints: list[str] = field(default_factory=list)
+
+
+def _skip(f: BufferedReader, length: int):
+    """skips length bytes, streams which can not seek (e.g. compressed) are read instead"""
+    try:
+        f.seek(length, os.SEEK_CUR)
+        return
+    except UnsupportedOperation:
+        pass
+
+    while length > 0:
+        chunk = f.read(min(length, COPY_CHUNK_SIZE))
+        if not chunk:
+            raise EOFError("unexpected end of file")
+        length -= len(chunk)
+
+def _skipString(f: BufferedReader):
+    _skip(f, readInt(f))
+
+def scanModel(f: BufferedReader) -> tuple[Header, list[Material], list[str]]:
+    """
+    reads the header, materials and tag point names of the model at the current position,
+    faces and frames are skipped using their record sizes
+    """
+    return _scanModel(f, True)
+
+def _scanModel(f: BufferedReader, tables: bool) -> tuple[Header, list[Material], list[str]]:
+    magic = f.read(4)
+    assert magic != CEM_MAGIC_COMPRESSED, "CEM file is compressed, open it with openCEM"
+    assert magic == CEM_MAGIC, "invalid CEM magic"
+
+    header = Header.parse(f)
+    assert header.version == 2, "only CEM v2 is supported"
+
+    # faces
+    for _ in range(header.lodLevels):
+        _skip(f, readInt(f) * 12)
+
+    materials = list()
+    tagPoints = list()
+
+    if tables:
+        materials = [Material.parse(f, header.lodLevels) for _ in range(header.materials)]
+        tagPoints = [readString(f) for _ in range(header.tagPoints)]
+    else:
+        # materials: name, texture index, triangle selections, vertex offset + count, texture name
+        for _ in range(header.materials):
+            _skipString(f)
+            _skip(f, 4 + header.lodLevels * 8 + 8)
+            _skipString(f)
+
+        # tag points
+        for _ in range(header.tagPoints):
+            _skipString(f)
+
+    _skip(f, header.frames * Frame.size(header))
+
+    return header, materials, tagPoints
+
+def indexChildModels(f: BufferedReader, tables: bool = False) -> list[ModelIndexEntry]:
+    """scans all models starting at the current position of f, with tables the entries include materials and tag points"""
+    entries: list[ModelIndexEntry] = list()
+
+    while True:
+        offset = f.tell()
+        header, materials, tagPoints = _scanModel(f, tables)
+
+        entries.append(ModelIndexEntry(
+            index=len(entries),
+            name=header.name,
+            offset=offset,
+            size=f.tell() - offset,
+            header=header,
+            materials=materials,
+            tagPoints=tagPoints
+        ))
+
+        if len(entries) > entries[0].header.childModels:
+            return entries
+
+def scanFile(filename: str) -> list[ModelIndexEntry]:
+    """
+    header, materials and tag points of the main model and all child models,
+    uncompressed files are only read up to the end of the tables of every model
+    """
+    with openCEM(filename) as f:
+        return indexChildModels(f, tables=True)
+
+def findFiles(paths: list[str]) -> list[tuple[str, str]]:
+    """returns (file, path relative to its root) for all CEM files found in paths"""
+    files = list()
+
+    for path in paths:
+        if os.path.isfile(path):
+            files.append((path, os.path.basename(path)))
+            continue
+
+        for root, _, filenames in os.walk(path):
+            for filename in sorted(filenames):
+                if filename.lower().endswith(".cem"):
+                    fullPath = os.path.join(root, filename)
+                    files.append((fullPath, os.path.relpath(fullPath, path)))
+
+    return files
+
+
+def readChildModel(f: BufferedReader, entry: ModelIndexEntry) -> CEMv2:
+    """parses a single model, f has to be seekable"""
+    f.seek(entry.offset)
+    return CEMv2.parse(f)
+
+def _copyBytes(src: BufferedReader, dst: BufferedWriter, length: int):
+    while length > 0:
+        chunk = src.read(min(length, COPY_CHUNK_SIZE))
+        if not chunk:
+            raise EOFError("unexpected end of file")
+        dst.write(chunk)
+        length -= len(chunk)
+
+def replaceChildModel(src: BufferedReader, dst: BufferedWriter, entries: list[ModelIndexEntry], index: int, cem: CEMv2):
+    """
+    writes src to dst with the model at index replaced by cem,
+    all other models are copied byte by byte without parsing them
+    """
+    entry = entries[index]
+
+    if index == 0:
+        # the main model carries the child model count of the whole file
+        cem.header.childModels = entry.header.childModels
+
+    src.seek(0)
+    _copyBytes(src, dst, entry.offset)
+
+    cem.serialize(dst)
+
+    src.seek(entry.offset + entry.size)
+    while chunk := src.read(COPY_CHUNK_SIZE):
+        dst.write(chunk)
@@ -0,0 +1,509 @@
+"""
+Mesh optimizations for CEM models, independent of Blender.
+"""
+
+import heapq
+
+import numpy as np
+
+from .CEM2 import CEMv2, Vector3d, FACE_DTYPE
+
+# weight of the planes which keep open borders and UV seams in place
+BOUNDARY_WEIGHT = 100.0
+
+
+## LOD generation
+
+def _planeQuadrics(planes: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """(n, 4) planes (a, b, c, d) into (n, 4, 4) weighted quadrics"""
+    return planes[:, :, None] * planes[:, None, :] * weights[:, None, None]
+
+def _vertexQuadrics(points: np.ndarray, faces: np.ndarray) -> np.ndarray:
+    p0, p1, p2 = (points[faces[:, i]] for i in range(3))
+
+    normals = np.cross(p1 - p0, p2 - p0)
+    lengths = np.linalg.norm(normals, axis=1)
+    normals /= np.maximum(lengths, 1e-12)[:, None]
+
+    planes = np.concatenate([normals, -np.einsum("ij,ij->i", normals, p0)[:, None]], axis=1)
+    faceQuadrics = _planeQuadrics(planes, lengths / 2)
+
+    quadrics = np.zeros((len(points), 4, 4))
+    for i in range(3):
+        np.add.at(quadrics, faces[:, i], faceQuadrics)
+
+    # boundary edges (only used by one face) get a perpendicular plane
+    edges = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+    edgeFaces = np.tile(np.arange(len(faces)), 3)
+    sortedEdges = np.sort(edges, axis=1)
+    _, inverse, counts = np.unique(sortedEdges, axis=0, return_inverse=True, return_counts=True)
+    boundary = counts[inverse.ravel()] == 1
+
+    if np.any(boundary):
+        a, b = points[edges[boundary, 0]], points[edges[boundary, 1]]
+        edgeNormals = np.cross(b - a, normals[edgeFaces[boundary]])
+        edgeLengths = np.linalg.norm(edgeNormals, axis=1)
+        edgeNormals /= np.maximum(edgeLengths, 1e-12)[:, None]
+
+        edgePlanes = np.concatenate([edgeNormals, -np.einsum("ij,ij->i", edgeNormals, a)[:, None]], axis=1)
+        edgeQuadrics = _planeQuadrics(edgePlanes, BOUNDARY_WEIGHT * np.einsum("ij,ij->i", b - a, b - a))
+
+        np.add.at(quadrics, edges[boundary, 0], edgeQuadrics)
+        np.add.at(quadrics, edges[boundary, 1], edgeQuadrics)
+
+    return quadrics
+
+def decimate(points: np.ndarray, faces: np.ndarray, targets: list[int]) -> list[np.ndarray]:
+    """
+    quadric error decimation with half-edge collapses,
+    vertices are only merged onto existing vertices, so the reduced face lists
+    stay valid for the vertex blocks of every frame
+
+    returns one face array per target face count (in descending order)
+    """
+    points = np.asarray(points, dtype=np.float64)
+    faceList = np.asarray(faces).reshape(-1, 3).tolist()
+
+    results: list[np.ndarray] = list()
+    targets = sorted(targets, reverse=True)
+
+    if not faceList:
+        return [np.zeros((0, 3), dtype=FACE_DTYPE) for _ in targets]
+
+    quadrics = _vertexQuadrics(points, np.asarray(faceList))
+    homogeneous = np.concatenate([points, np.ones((len(points), 1))], axis=1)
+
+    # the collapse loop runs on plain floats, numpy calls are too slow for single values
+    # symmetric quadrics are stored as their 10 upper triangle coefficients
+    upper = np.triu_indices(4)
+    quadricList = quadrics[:, upper[0], upper[1]].tolist()
+    pointList = points.tolist()
+
+    vertexFaces: list[set] = [set() for _ in range(len(points))]
+    for f, face in enumerate(faceList):
+        for v in face:
+            vertexFaces[v].add(f)
+
+    alive = [True] * len(faceList)
+    numFaces = len(faceList)
+    version = [0] * len(points)
+
+    def costs(u: int, v: int) -> tuple[float, float]:
+        """error of moving u onto v and of moving v onto u"""
+        a, b, c, d, e, f, g, h, i, j = map(float.__add__, quadricList[u], quadricList[v])
+        x, y, z = pointList[v]
+        p, q, r = pointList[u]
+
+        return (
+            a*x*x + 2*b*x*y + 2*c*x*z + 2*d*x + e*y*y + 2*f*y*z + 2*g*y + h*z*z + 2*i*z + j,
+            a*p*p + 2*b*p*q + 2*c*p*r + 2*d*p + e*q*q + 2*f*q*r + 2*g*q + h*r*r + 2*i*r + j
+        )
+
+    def faceNormal(a: int, b: int, c: int) -> tuple:
+        ax, ay, az = pointList[a]
+        ux, uy, uz = pointList[b][0] - ax, pointList[b][1] - ay, pointList[b][2] - az
+        vx, vy, vz = pointList[c][0] - ax, pointList[c][1] - ay, pointList[c][2] - az
+        return (uy*vz - uz*vy, uz*vx - ux*vz, ux*vy - uy*vx)
+
+    def flips(u: int, v: int) -> bool:
+        """true if moving u onto v turns any remaining face around"""
+        for f in vertexFaces[u]:
+            face = faceList[f]
+            if v in face:
+                continue
+
+            moved = [v if x == u else x for x in face]
+            before, after = faceNormal(*face), faceNormal(*moved)
+            if before[0]*after[0] + before[1]*after[1] + before[2]*after[2] <= 0:
+                return True
+
+        return False
+
+    # initial costs of all edges in both directions
+    edges = np.unique(np.sort(np.concatenate([
+        np.asarray(faceList)[:, [0, 1]],
+        np.asarray(faceList)[:, [1, 2]],
+        np.asarray(faceList)[:, [2, 0]]
+    ]), axis=1), axis=0)
+
+    edgeQuadrics = quadrics[edges[:, 0]] + quadrics[edges[:, 1]]
+    costsUV = np.einsum("ei,eij,ej->e", homogeneous[edges[:, 1]], edgeQuadrics, homogeneous[edges[:, 1]])
+    costsVU = np.einsum("ei,eij,ej->e", homogeneous[edges[:, 0]], edgeQuadrics, homogeneous[edges[:, 0]])
+
+    # (cost, u, v, version of u, version of v), u -> v moves u onto the position of v
+    heap = list()
+    for (u, v), costUV, costVU in zip(edges.tolist(), costsUV.tolist(), costsVU.tolist()):
+        heap.append((costUV, u, v, 0, 0))
+        heap.append((costVU, v, u, 0, 0))
+    heapq.heapify(heap)
+
+    def snapshot():
+        results.append(np.array([x for x, a in zip(faceList, alive) if a], dtype=FACE_DTYPE).reshape(-1, 3))
+
+    for target in targets:
+        while numFaces > target and heap:
+            _, u, v, versionU, versionV = heapq.heappop(heap)
+
+            if versionU != version[u] or versionV != version[v] or not vertexFaces[u]:
+                continue
+            if flips(u, v):
+                continue
+
+            # collapse u onto v
+            for f in vertexFaces[u]:
+                face = faceList[f]
+                if v in face:
+                    alive[f] = False
+                    numFaces -= 1
+                    for x in face:
+                        if x != u:
+                            vertexFaces[x].discard(f)
+                else:
+                    face[face.index(u)] = v
+                    vertexFaces[v].add(f)
+
+            vertexFaces[u] = set()
+            version[u] += 1
+            version[v] += 1
+            quadricList[v] = list(map(float.__add__, quadricList[v], quadricList[u]))
+
+            neighbours = {x for f in vertexFaces[v] for x in faceList[f]} - {v}
+            for w in neighbours:
+                costVW, costWV = costs(v, w)
+                heapq.heappush(heap, (costVW, v, w, version[v], version[w]))
+                heapq.heappush(heap, (costWV, w, v, version[w], version[v]))
+
+        snapshot()
+
+    return results
+
+def generateLODs(cem: CEMv2, lodLevels: int, ratio: float = 0.5):
+    """
+    replaces the lower LOD levels of cem with decimated versions of LOD 1,
+    every level keeps ratio of the faces of the level above (per material)
+    """
+    points = cem.frames[0].points if cem.frames else np.zeros((cem.header.vertices, 3))
+
+    # per LOD level a list of face arrays, one per material
+    lodFaces: list[list[np.ndarray]] = [list() for _ in range(lodLevels)]
+
+    for material in cem.materials:
+        offset, count = material.triangleSelections[0]
+        faces = np.asarray(cem.faces[0][offset : offset + count])
+
+        vStart = material.vertexOffset
+        vEnd = vStart + material.vertexCount
+
+        targets = [int(round(count * ratio ** level)) for level in range(1, lodLevels)]
+        levels = [faces] + decimate(points[vStart:vEnd], faces, targets)
+
+        for level, levelFaces in enumerate(levels):
+            lodFaces[level].append(levelFaces)
+
+    # LOD 1 stays as it is
+    cem.faces = [cem.faces[0]]
+    selections = [[material.triangleSelections[0]] for material in cem.materials]
+
+    for level in range(1, lodLevels):
+        offset = 0
+        for i, faces in enumerate(lodFaces[level]):
+            selections[i].append((offset, len(faces)))
+            offset += len(faces)
+
+        if lodFaces[level]:
+            cem.faces.append(np.concatenate(lodFaces[level]).astype(FACE_DTYPE))
+        else:
+            cem.faces.append(np.zeros((0, 3), dtype=FACE_DTYPE))
+
+    for material, selection in zip(cem.materials, selections):
+        material.triangleSelections = selection
+
+    cem.header.lodLevels = lodLevels
+
+
+## vertex cache optimization
+
+# simulated post-transform cache and scoring constants from
+# Tom Forsyth, "Linear-Speed Vertex Cache Optimisation"
+VERTEX_CACHE_SIZE = 32
+CACHE_DECAY_POWER = 1.5
+LAST_TRIANGLE_SCORE = 0.75
+VALENCE_BOOST_SCALE = 2.0
+VALENCE_BOOST_POWER = 0.5
+
+def _cacheMisses(faces: np.ndarray, cacheSize: int) -> int:
+    """transformed vertices of one draw call with a FIFO cache, which starts empty"""
+    cache = list()
+    cached = set()
+    misses = 0
+
+    for v in np.asarray(faces).ravel().tolist():
+        if v in cached:
+            continue
+
+        misses += 1
+        cache.append(v)
+        cached.add(v)
+
+        if len(cache) > cacheSize:
+            cached.discard(cache.pop(0))
+
+    return misses
+
+def acmr(faces: np.ndarray, cacheSize: int = VERTEX_CACHE_SIZE) -> float:
+    """average cache miss ratio (transformed vertices per triangle) of one draw call with a FIFO cache"""
+    numFaces = np.asarray(faces).size // 3
+    if numFaces == 0:
+        return 0.0
+
+    return _cacheMisses(faces, cacheSize) / numFaces
+
+def modelAcmr(cem: CEMv2, lodLevel: int = 0, cacheSize: int = VERTEX_CACHE_SIZE) -> float:
+    """
+    ACMR of one LOD level, every material is its own draw call with
+    material local indices, so the cache is reset between them
+    """
+    misses = 0
+    numFaces = 0
+
+    for material in cem.materials:
+        offset, count = material.triangleSelections[lodLevel]
+        misses += _cacheMisses(cem.faces[lodLevel][offset : offset + count], cacheSize)
+        numFaces += count
+
+    return misses / numFaces if numFaces else 0.0
+
+def _vertexScore(cachePosition: int, remaining: int) -> float:
+    if remaining == 0:
+        return -1.0
+
+    score = 0.0
+    if cachePosition >= 0:
+        if cachePosition < 3:
+            # vertices of the last triangle, which should not be used right away again
+            score = LAST_TRIANGLE_SCORE
+        else:
+            score = (1.0 - (cachePosition - 3) / (VERTEX_CACHE_SIZE - 3)) ** CACHE_DECAY_POWER
+
+    # vertices with few triangles left get a boost, so they are finished off
+    return score + VALENCE_BOOST_SCALE * remaining ** -VALENCE_BOOST_POWER
+
+def optimizeVertexCache(faces: np.ndarray) -> np.ndarray:
+    """reorders triangles for a better post-transform vertex cache hit rate"""
+    faceList = np.asarray(faces).reshape(-1, 3).tolist()
+    if not faceList:
+        return np.zeros((0, 3), dtype=FACE_DTYPE)
+
+    numVertices = max(max(face) for face in faceList) + 1
+
+    vertexFaces: list[list[int]] = [list() for _ in range(numVertices)]
+    for f, face in enumerate(faceList):
+        for v in face:
+            vertexFaces[v].append(f)
+
+    cachePositions = [-1] * numVertices
+    vertexScores = [_vertexScore(-1, len(x)) for x in vertexFaces]
+    faceScores = [sum(vertexScores[v] for v in face) for face in faceList]
+    added = [False] * len(faceList)
+
+    order = list()
+    cache = list()
+    bestFace = max(range(len(faceList)), key=faceScores.__getitem__)
+
+    while len(order) < len(faceList):
+        if bestFace < 0:
+            # nothing in the cache is connected to a remaining face, start a new island
+            bestFace = max((f for f in range(len(faceList)) if not added[f]), key=faceScores.__getitem__)
+
+        face = faceList[bestFace]
+        order.append(bestFace)
+        added[bestFace] = True
+
+        for v in face:
+            vertexFaces[v].remove(bestFace)
+
+        newCache = face + [v for v in cache if v not in face]
+        evicted = newCache[VERTEX_CACHE_SIZE:]
+        cache = newCache[:VERTEX_CACHE_SIZE]
+
+        for v in evicted:
+            cachePositions[v] = -1
+        for i, v in enumerate(cache):
+            cachePositions[v] = i
+
+        # rescore everything that moved in or out of the cache
+        for v in cache + evicted:
+            score = _vertexScore(cachePositions[v], len(vertexFaces[v]))
+            delta = score - vertexScores[v]
+            vertexScores[v] = score
+
+            for f in vertexFaces[v]:
+                faceScores[f] += delta
+
+        bestFace = -1
+        bestScore = -1.0
+        for v in cache:
+            for f in vertexFaces[v]:
+                if faceScores[f] > bestScore:
+                    bestFace, bestScore = f, faceScores[f]
+
+    return np.asarray(faceList, dtype=FACE_DTYPE)[order]
+
+def optimizeModelCache(cem: CEMv2) -> tuple[float, float]:
+    """
+    reorders the faces of every material and LOD level for the vertex cache and
+    renumbers each material's vertices in order of first use in LOD 1
+
+    returns the ACMR of LOD 1 before and after
+    """
+    before = modelAcmr(cem) if cem.header.lodLevels else 0.0
+
+    for level in range(cem.header.lodLevels):
+        lodFaces = np.array(cem.faces[level], dtype=FACE_DTYPE)
+
+        for material in cem.materials:
+            offset, count = material.triangleSelections[level]
+            lodFaces[offset : offset + count] = optimizeVertexCache(lodFaces[offset : offset + count])
+
+        cem.faces[level] = lodFaces
+
+    # vertex renumbering needs disjoint vertex ranges, which is what the exporter writes
+    if _disjointVertexRanges(cem):
+        _remapVertices(cem)
+
+    after = modelAcmr(cem) if cem.header.lodLevels else 0.0
+
+    return before, after
+
+def _disjointVertexRanges(cem: CEMv2) -> bool:
+    ranges = sorted((x.vertexOffset, x.vertexOffset + x.vertexCount) for x in cem.materials)
+    return all(a[1] <= b[0] for a, b in zip(ranges, ranges[1:]))
+
+def _remapFrames(cem: CEMv2, indices: np.ndarray):
+    """picks the given vertex rows of every frame, frames sharing a vertex block keep sharing it"""
+    remapped = dict()
+    for frame in cem.frames:
+        key = id(frame.vertexData)
+        if key not in remapped:
+            remapped[key] = (frame.vertexData, np.ascontiguousarray(frame.vertexData[indices]))
+        frame.vertexData = remapped[key][1]
+
+def _remapVertices(cem: CEMv2):
+    """renumbers each material's vertices in order of first use in LOD 1, unused ones go last"""
+    permutation = np.arange(cem.header.vertices)
+
+    for material in cem.materials:
+        offset, count = material.triangleSelections[0]
+        used = np.asarray(cem.faces[0][offset : offset + count]).ravel()
+
+        # unique in order of first appearance, followed by the unused vertices
+        firstUse = used[np.sort(np.unique(used, return_index=True)[1])]
+        unused = np.setdiff1d(np.arange(material.vertexCount), firstUse)
+
+        newOrder = np.concatenate([firstUse, unused]).astype(np.int64)
+        permutation[material.vertexOffset : material.vertexOffset + material.vertexCount] = material.vertexOffset + newOrder
+
+        # faces use material local indices
+        oldToNew = np.empty(material.vertexCount, dtype=FACE_DTYPE)
+        oldToNew[newOrder] = np.arange(material.vertexCount, dtype=FACE_DTYPE)
+
+        for level in range(cem.header.lodLevels):
+            offset, count = material.triangleSelections[level]
+            cem.faces[level][offset : offset + count] = oldToNew[cem.faces[level][offset : offset + count]]
+
+    _remapFrames(cem, permutation)
+
+
+## vertex welding
+
+def weldVertices(cem: CEMv2) -> tuple[int, int]:
+    """
+    merges vertices of a material which are identical in every frame and
+    drops vertices no face of any LOD level references
+
+    returns the vertex count before and after
+    """
+    before = cem.header.vertices
+
+    if not cem.frames or not _disjointVertexRanges(cem):
+        return before, before
+
+    # frames sharing a vertex block only need to be compared once
+    blocks = list({id(x.vertexData): x.vertexData for x in cem.frames}.values())
+    cem.faces = [np.array(x, dtype=FACE_DTYPE).reshape(-1, 3) for x in cem.faces]
+
+    keptVertices = list()
+    vertexOffset = 0
+
+    for material in sorted(cem.materials, key=lambda x: x.vertexOffset):
+        start, count = material.vertexOffset, material.vertexCount
+
+        # one row per vertex holding its data of all frames
+        rows = np.ascontiguousarray(np.concatenate([x[start : start + count] for x in blocks], axis=1))
+        keys = rows.view(np.dtype((np.void, rows.shape[1] * rows.itemsize))).ravel()
+
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        canonical = first[inverse.ravel()]
+
+        referenced = np.zeros(count, dtype=bool)
+        for level in range(cem.header.lodLevels):
+            offset, faceCount = material.triangleSelections[level]
+            referenced[canonical[np.asarray(cem.faces[level][offset : offset + faceCount]).ravel()]] = True
+
+        keep = np.flatnonzero(referenced)
+        newIndex = np.zeros(count, dtype=FACE_DTYPE)
+        newIndex[keep] = np.arange(len(keep), dtype=FACE_DTYPE)
+        oldToNew = newIndex[canonical]
+
+        for level in range(cem.header.lodLevels):
+            offset, faceCount = material.triangleSelections[level]
+            cem.faces[level][offset : offset + faceCount] = oldToNew[cem.faces[level][offset : offset + faceCount]]
+
+        keptVertices.append(start + keep)
+        material.vertexOffset = vertexOffset
+        material.vertexCount = len(keep)
+        vertexOffset += len(keep)
+
+    _remapFrames(cem, np.concatenate(keptVertices) if keptVertices else np.zeros(0, dtype=np.int64))
+    cem.header.vertices = vertexOffset
+
+    return before, vertexOffset
+
+
+## bounds
+
+def calcFrameBounds(cem: CEMv2):
+    """
+    sets the bounds and radius of every frame from its vertex data;
+    the radius is the smallest sphere around the center of the bounds
+    containing all vertices, as the sphere center is not stored
+    """
+    # frames sharing a vertex block are only computed once
+    blocks = dict()
+    for frame in cem.frames:
+        blocks.setdefault(id(frame.vertexData), frame.vertexData)
+
+    if not blocks or cem.header.vertices == 0:
+        for frame in cem.frames:
+            frame.radius = 0.0
+            frame.lowerBound, frame.upperBound = Vector3d(), Vector3d()
+        return
+
+    # (blocks, vertices, 3)
+    points = np.stack([x[:, 0:3] for x in blocks.values()]).astype(np.float64)
+
+    lower = points.min(axis=1)
+    upper = points.max(axis=1)
+    center = (lower + upper) / 2
+    radius = np.sqrt(((points - center[:, None]) ** 2).sum(axis=2).max(axis=1))
+
+    # rounded up, so float32 never makes the sphere smaller than the model
+    radius = np.nextafter(radius.astype(np.float32), np.float32(np.inf))
+
+    bounds = {
+        key: (Vector3d(*lo), Vector3d(*hi), r)
+        for key, lo, hi, r in zip(blocks, lower.tolist(), upper.tolist(), radius.tolist())
+    }
+
+    for frame in cem.frames:
+        frame.lowerBound, frame.upperBound, frame.radius = bounds[id(frame.vertexData)]
@@ -0,0 +1,106 @@
+"""
+Memory-mapped lazy CEM reader.
+
+Only the header, face, material and tag point tables are parsed up front.
+Frames are decoded on access, their vertex data is a zero-copy view into
+the mapped file, so memory usage does not grow with the number of frames.
+"""
+
+import mmap
+
+from collections.abc import Sequence
+
+from .CEM2 import CEMv2, Frame, Header, CEM_MAGIC_COMPRESSED
+from .compression import PK01Reader, CHUNK_SIZE
+from .index import ModelIndexEntry, indexChildModels
+
+
+def mapFile(filename: str) -> mmap.mmap:
+    """maps a CEM file read-only, compressed files are decompressed into an anonymous map"""
+    with open(filename, "rb") as f:
+        if f.peek(4)[:4] != CEM_MAGIC_COMPRESSED:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        f.read(4)
+        stream = PK01Reader(f)
+
+        buffer = mmap.mmap(-1, max(1, stream.size))
+        view = memoryview(buffer)
+
+        position = 0
+        while position < stream.size:
+            read = stream.readinto(view[position : position + CHUNK_SIZE])
+            if not read:
+                raise EOFError("PK01 stream is shorter than its header says")
+            position += read
+
+        view.release()
+        return buffer
+
+
+class FrameSequence(Sequence):
+    """list-like access to the frames of one model, decoding each frame on demand"""
+
+    def __init__(self, buffer, offset: int, header: Header):
+        self._buffer = buffer
+        self._header = header
+        self._frameSize = Frame.size(header)
+
+        self.offset = offset
+
+    def __len__(self) -> int:
+        return self._header.frames
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("frame index out of range")
+
+        return Frame.fromBuffer(self._buffer, self.offset + index * self._frameSize, self._header)
+
+    @property
+    def size(self) -> int:
+        return len(self) * self._frameSize
+
+
+class CEMReader:
+    """
+    opens a CEM file and lazily reads the main model and all child models,
+    compressed files are decompressed into an anonymous map first
+
+    frames stay valid for as long as they are referenced, even after close()
+    """
+
+    def __init__(self, filename: str):
+        self._buffer = mapFile(filename)
+
+        self.index: list[ModelIndexEntry] = indexChildModels(self._buffer)
+        self.models: list[CEMv2] = [self._readModel(x.offset) for x in self.index]
+
+    def _readModel(self, offset: int) -> CEMv2:
+        self._buffer.seek(offset)
+        cem = CEMv2.parseTables(self._buffer)
+        cem.frames = FrameSequence(self._buffer, self._buffer.tell(), cem.header)
+
+        if cem.frames.offset + cem.frames.size > len(self._buffer):
+            raise EOFError(f"frames of '{cem.header.name}' exceed the file size")
+
+        return cem
+
+    def close(self):
+        self.models.clear()
+        try:
+            self._buffer.close()
+        except BufferError:
+            # frame views are still referenced, the map gets released with them
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,101 @@
+"""
+Synthetic CEM models for benchmarks and tests.
+
+Models are random but structurally valid: every material owns its own
+vertex range, lower LOD levels have half the faces of the level above
+and each frame carries its own pose.
+"""
+
+import numpy as np
+
+from .CEM2 import CEMv2, Header, Vector3d, Material, Matrix4x4, Frame, FACE_DTYPE, VERTEX_DTYPE, VERTEX_FIELDS
+from .meshopt import calcFrameBounds
+
+IDENTITY = Matrix4x4(
+    1, 0, 0, 0,
+    0, 1, 0, 0,
+    0, 0, 1, 0,
+    0, 0, 0, 1
+)
+
+
+def generateModel(vertices: int = 1000, frames: int = 1, lodLevels: int = 1, tagPoints: int = 0,
+                  materials: int = 1, name: str = "Scene Root", seed: int = 0) -> CEMv2:
+    """one model with about two faces per vertex in LOD 1"""
+    rng = np.random.default_rng(seed)
+
+    materials = max(1, min(materials, vertices))
+    vertexCounts = np.full(materials, vertices // materials)
+    vertexCounts[: vertices % materials] += 1
+    vertexOffsets = np.concatenate([[0], np.cumsum(vertexCounts)[:-1]])
+
+    # faces of all materials one after another, per LOD level
+    lodFaces = [list() for _ in range(lodLevels)]
+    selections = [list() for _ in range(materials)]
+
+    for level in range(lodLevels):
+        first = 0
+        for m, count in enumerate(vertexCounts.tolist()):
+            numFaces = max(1, (2 * count) >> level)
+            lodFaces[level].append(rng.integers(0, count, (numFaces, 3), dtype=FACE_DTYPE))
+            selections[m].append((first, numFaces))
+            first += numFaces
+
+    faces = [np.concatenate(x) for x in lodFaces]
+
+    # a base mesh with a small offset per frame
+    base = rng.standard_normal((vertices, VERTEX_FIELDS)).astype(VERTEX_DTYPE)
+
+    frameList = list()
+    for i in range(frames):
+        vertexData = base.copy()
+        vertexData[:, 0:3] += rng.standard_normal((vertices, 3)).astype(VERTEX_DTYPE) * 0.01 * i
+
+        # bounds are filled in below
+        frameList.append(Frame(
+            radius=0.0,
+            vertexData=vertexData,
+            tagPoints=[Vector3d(*x) for x in rng.standard_normal((tagPoints, 3)).tolist()],
+            transformationMatrix=IDENTITY,
+            lowerBound=Vector3d(),
+            upperBound=Vector3d()
+        ))
+
+    header = Header(
+        faces=len(faces[0]),
+        vertices=vertices,
+        tagPoints=tagPoints,
+        materials=materials,
+        frames=frames,
+        lodLevels=lodLevels,
+        name=name
+    )
+
+    cem = CEMv2(
+        header=header,
+        faces=faces,
+        materials=[
+            Material(
+                name=f"material {m}",
+                textureIndex=m,
+                triangleSelections=selections[m],
+                vertexOffset=int(vertexOffsets[m]),
+                vertexCount=int(vertexCounts[m]),
+                textureName=f"texture_{m}.tga"
+            ) for m in range(materials)
+        ],
+        frames=frameList,
+        tagPoints=[f"tag point {t}" for t in range(tagPoints)]
+    )
+    calcFrameBounds(cem)
+
+    return cem
+
+def generateModels(childModels: int = 0, seed: int = 0, **kwargs) -> list[CEMv2]:
+    """main model plus child models, kwargs are passed on to generateModel"""
+    models = [generateModel(seed=seed, **kwargs)]
+    models += [generateModel(name=f"child {i}", seed=seed + i, **kwargs) for i in range(1, childModels + 1)]
+
+    models[0].header.childModels = childModels
+
+    return models
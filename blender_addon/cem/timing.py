@@ -0,0 +1,78 @@
+"""
+Optional timing instrumentation for parsing, importing and exporting.
+
+Everything is logged to the "cem" logger on DEBUG level, which is silent
+unless enableTiming() is called. Per phase totals (time and bytes) are
+collected and can be logged with logTotals().
+"""
+
+import logging
+import threading
+import time
+
+from contextlib import contextmanager
+
+logger = logging.getLogger("cem")
+logger.addHandler(logging.NullHandler())
+
+_lock = threading.Lock()
+_totals: dict[str, list] = dict()
+
+
+def enableTiming(enabled: bool = True):
+    """enables timing output on stderr"""
+    if enabled and not any(isinstance(x, logging.StreamHandler) for x in logger.handlers):
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("[cem] %(message)s"))
+        logger.addHandler(handler)
+
+    logger.setLevel(logging.DEBUG if enabled else logging.NOTSET)
+
+def timingEnabled() -> bool:
+    return logger.isEnabledFor(logging.DEBUG)
+
+
+@contextmanager
+def phase(name: str, f=None):
+    """
+    measures the duration of the with block,
+    if f is given the bytes read from / written to it are counted as well
+    """
+    if not timingEnabled():
+        yield
+        return
+
+    start = time.perf_counter()
+    startPos = f.tell() if f is not None else 0
+
+    yield
+
+    seconds = time.perf_counter() - start
+    numBytes = f.tell() - startPos if f is not None else 0
+
+    with _lock:
+        total = _totals.setdefault(name, [0, 0.0, 0])
+        total[0] += 1
+        total[1] += seconds
+        total[2] += numBytes
+
+    logger.debug("%-12s %9.3f ms %10d bytes", name, seconds * 1000, numBytes)
+
+def getTotals() -> dict[str, dict]:
+    with _lock:
+        return {
+            name: dict(calls=calls, seconds=seconds, bytes=numBytes)
+            for name, (calls, seconds, numBytes) in _totals.items()
+        }
+
+def logTotals(reset: bool = True):
+    """logs the accumulated time per phase"""
+    if not timingEnabled():
+        return
+
+    for name, total in getTotals().items():
+        logger.debug("total %-12s %9.3f ms %10d bytes (%d calls)", name, total["seconds"] * 1000, total["bytes"], total["calls"])
+
+    if reset:
+        with _lock:
+            _totals.clear()
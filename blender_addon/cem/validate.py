@@ -0,0 +1,199 @@
+"""
+Streaming CEM validator.
+
+Walks through all models of a file without decoding frames and reports
+every problem with the byte offset it was found at. Offsets of compressed
+files refer to the decompressed data.
+"""
+
+import os
+import struct
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from .CEM2 import Frame, Header, CEM_MAGIC, CEM_MAGIC_COMPRESSED, FACE_DTYPE
+from .reader import mapFile
+
+# header after the magic: version shorts, 7 counts, name, center
+HEADER_COUNTS = struct.Struct("<HH7I")
+# first face and face count of one LOD level
+SELECTION = struct.Struct("<II")
+
+
+@dataclass
+class ValidationIssue:
+    offset: int
+    # 0 is the main model, child models start at 1
+    model: int
+    message: str
+
+    def __str__(self) -> str:
+        return f"0x{self.offset:08x} model {self.model}: {self.message}"
+
+
+class _Truncated(Exception):
+    """the rest of the model can not be located anymore"""
+
+
+class _Validator:
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.size = len(buffer)
+        self.position = 0
+        self.model = 0
+
+        self.issues: list[ValidationIssue] = list()
+
+    def report(self, offset: int, message: str):
+        self.issues.append(ValidationIssue(offset, self.model, message))
+
+    def need(self, length: int, what: str):
+        if self.position + length > self.size:
+            self.report(self.position, f"{what} needs {length} bytes, only {self.size - self.position} left")
+            raise _Truncated()
+
+    def unpack(self, fmt: struct.Struct, what: str) -> tuple:
+        self.need(fmt.size, what)
+        values = fmt.unpack_from(self.buffer, self.position)
+        self.position += fmt.size
+        return values
+
+    def readInt(self, what: str) -> int:
+        self.need(4, what)
+        value, = struct.unpack_from("<I", self.buffer, self.position)
+        self.position += 4
+        return value
+
+    def readString(self, what: str) -> str:
+        length = self.readInt(f"{what} length")
+        self.need(length, what)
+        value = bytes(self.buffer[self.position : self.position + length])
+        self.position += length
+        return value.strip(b"\0").decode("iso8859-15")
+
+    def validateModel(self) -> int:
+        """validates the model at the current position, returns its child model count"""
+        start = self.position
+
+        self.need(4, "magic")
+        magic = bytes(self.buffer[start : start + 4])
+        if magic != CEM_MAGIC:
+            self.report(start, f"invalid magic {magic!r}")
+            raise _Truncated()
+        self.position += 4
+
+        vMaj, vMin, numFaces, numVertices, numTagPoints, numMaterials, numFrames, childModels, lodLevels = \
+            self.unpack(HEADER_COUNTS, "header")
+        if (vMaj, vMin) != (2, 0):
+            self.report(start + 4, f"unsupported version {vMaj}.{vMin}")
+
+        self.readString("model name")
+        self.need(12, "center")
+        self.position += 12
+
+        # faces, indices are checked against the materials below
+        faces = list()
+        for level in range(lodLevels):
+            offset = self.position
+            count = self.readInt(f"face count of LOD {level + 1}")
+            self.need(count * 12, f"{count} faces of LOD {level + 1}")
+
+            faces.append((offset + 4, np.frombuffer(self.buffer, dtype=FACE_DTYPE, count=count * 3, offset=offset + 4)))
+            self.position += count * 12
+
+        # materials
+        covered = [np.zeros(len(x[1]) // 3, dtype=bool) for x in faces]
+
+        for m in range(numMaterials):
+            offset = self.position
+            name = self.readString(f"name of material {m}")
+            self.readInt(f"texture index of material {m}")
+
+            selections = [
+                (self.position, self.unpack(SELECTION, f"LOD {level + 1} selection of material {m}"))
+                for level in range(lodLevels)
+            ]
+
+            vertexOffset = self.readInt(f"vertex offset of material {m}")
+            vertexCount = self.readInt(f"vertex count of material {m}")
+            self.readString(f"texture name of material {m}")
+
+            if vertexOffset + vertexCount > numVertices:
+                self.report(offset, f"material '{name}' uses vertices {vertexOffset} to {vertexOffset + vertexCount}, the model has {numVertices}")
+
+            for level, (selectionOffset, (first, count)) in enumerate(selections):
+                facesOffset, indices = faces[level]
+                numLodFaces = len(indices) // 3
+
+                if first + count > numLodFaces:
+                    self.report(selectionOffset, f"material '{name}' selects faces {first} to {first + count} of LOD {level + 1}, it has {numLodFaces}")
+                    continue
+
+                covered[level][first : first + count] = True
+
+                # face indices are relative to the vertex range of the material
+                bad = np.flatnonzero(indices[first * 3 : (first + count) * 3] >= vertexCount)
+                if len(bad):
+                    # plain ints, numpy integers do not survive json.dump
+                    index = first * 3 + int(bad[0])
+                    self.report(facesOffset + index * 4, f"LOD {level + 1} face {index // 3} of material '{name}' uses vertex {int(indices[index])}, the material has {vertexCount} ({len(bad)} bad indices)")
+
+        # faces outside of all selections can only be checked against the whole model
+        for level, (facesOffset, indices) in enumerate(faces):
+            loose = np.repeat(~covered[level], 3)
+            bad = np.flatnonzero(loose & (indices >= numVertices))
+            if len(bad):
+                index = int(bad[0])
+                self.report(facesOffset + index * 4, f"LOD {level + 1} face {index // 3} uses vertex {int(indices[index])}, the model has {numVertices} ({len(bad)} bad indices)")
+
+        # tag points
+        for t in range(numTagPoints):
+            self.readString(f"name of tag point {t}")
+
+        # frames
+        frameSize = Frame.size(Header(vertices=numVertices, tagPoints=numTagPoints))
+        self.need(numFrames * frameSize, f"{numFrames} frames of {frameSize} bytes")
+        self.position += numFrames * frameSize
+
+        return childModels
+
+    def validate(self):
+        try:
+            childModels = self.validateModel()
+
+            for self.model in range(1, childModels + 1):
+                self.validateModel()
+        except _Truncated:
+            return
+
+        if self.position < self.size:
+            self.report(self.position, f"{self.size - self.position} trailing bytes after the last model")
+
+
+def validateBuffer(buffer) -> list[ValidationIssue]:
+    """validates decompressed CEM data"""
+    validator = _Validator(buffer)
+    validator.validate()
+
+    return validator.issues
+
+def validateFile(filename: str) -> list[ValidationIssue]:
+    if os.path.getsize(filename) == 0:
+        return [ValidationIssue(0, 0, "empty file")]
+
+    try:
+        buffer = mapFile(filename)
+    except (EOFError, OSError, ValueError) as e:
+        # broken PK01 stream
+        return [ValidationIssue(len(CEM_MAGIC_COMPRESSED), 0, f"can not decompress: {e}")]
+
+    try:
+        return validateBuffer(buffer)
+    finally:
+        try:
+            buffer.close()
+        except BufferError:
+            pass
@@ -0,0 +1,127 @@
+"""
+Command line tool for validating, indexing and converting CEM files without Blender.
+
+usage:
+    python -m blender_addon.cli validate Data/models
+    python -m blender_addon.cli index Data/models
+    python -m blender_addon.cli convert Data/models --output out/
+
+Files are processed in parallel and a JSON report with per file timings
+and errors is written to stdout (or --report). validate reports every
+problem with the byte offset it was found at.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+
+from .cem import parseModels, serializeModels, openCEM, createCEM, indexChildModels, findFiles, validateFile, enableTiming, getTotals, logTotals
+
+
+def _readModels(filename: str):
+    with openCEM(filename) as f:
+        models = parseModels(f)
+
+        trailing = len(f.read())
+        if trailing:
+            raise ValueError(f"{trailing} trailing bytes after the last child model")
+
+    return models
+
+def _processFile(job: tuple) -> dict:
+    command, filename, relPath, options = job
+
+    if options["timing"]:
+        enableTiming()
+
+    result = dict(file=filename, ok=True)
+    start = time.perf_counter()
+
+    try:
+        if command == "index":
+            with openCEM(filename) as f:
+                entries = indexChildModels(f)
+
+            result["models"] = [
+                dict(index=x.index, name=x.name, offset=x.offset, size=x.size) for x in entries
+            ]
+        elif command == "validate":
+            # streams through the file without decoding any frames
+            issues = validateFile(filename)
+
+            result["ok"] = not issues
+            result["issues"] = [dict(offset=x.offset, model=x.model, message=x.message) for x in issues]
+        else:
+            models = _readModels(filename)
+            result["childModels"] = len(models) - 1
+            result["vertices"] = sum(x.header.vertices for x in models)
+            result["frames"] = models[0].header.frames
+
+        if command == "convert":
+            output = os.path.join(options["output"], relPath)
+            os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+
+            with createCEM(output, options["compress"]) as f:
+                serializeModels(f, models)
+
+            result["output"] = output
+
+    except Exception as e:
+        result["ok"] = False
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    result["seconds"] = time.perf_counter() - start
+    if options["timing"]:
+        result["phases"] = getTotals()
+        logTotals()
+
+    return result
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="cemtool", description="validate and convert Empire Earth CEM files")
+    parser.add_argument("command", choices=("validate", "index", "convert"))
+    parser.add_argument("paths", nargs="+", help="CEM files or directories to search for CEM files")
+    parser.add_argument("-o", "--output", help="output directory for convert")
+    parser.add_argument("--compress", action="store_true", help="write compressed (PK01) files, experimental: the layout is not verified against the game yet")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument("--timing", action="store_true", help="log per phase timings to stderr and add them to the report")
+    parser.add_argument("--report", help="write the JSON report to this file instead of stdout")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "convert" and not args.output:
+        parser.error("convert requires --output")
+
+    options = dict(output=args.output, compress=args.compress, timing=args.timing)
+    jobs = [(args.command, filename, relPath, options) for filename, relPath in findFiles(args.paths)]
+
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        results = list(pool.map(_processFile, jobs, chunksize=16))
+
+    report = dict(
+        command=args.command,
+        files=len(results),
+        failed=sum(not x["ok"] for x in results),
+        seconds=time.perf_counter() - start,
+        results=results,
+    )
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
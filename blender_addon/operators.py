@@ -0,0 +1,343 @@
+import os
+import time
+
+import bpy
+
+# the importer and exporter pull in numpy and the CEM format code,
+# they are imported on first use to keep addon registration fast
+from . import utils
+from .utils import EMPTY_SIZE
+
+from bpy.props import StringProperty, BoolProperty, EnumProperty, IntProperty, FloatProperty, CollectionProperty
+from bpy_extras.io_utils import ImportHelper, path_reference_mode
+
+# seconds between two steps of a background import and the time spent per step,
+# everything else is left to Blender's UI
+IMPORT_TIMER_STEP = 0.02
+IMPORT_TIME_SLICE = 0.05
+
+
+class ImportCEM(bpy.types.Operator, ImportHelper):
+#class ImportCEM(bpy.types.Operator):
+    """Import an Empire Earth CEM file"""
+    bl_idname = "import_scene.cem"  # important since its how bpy.ops.import_test.some_data is constructed
+    bl_label = "Import CEM"
+
+    # ImportHelper mixin class uses this
+    filename_ext = ".cem"
+
+    filter_glob: StringProperty(
+        default="*.cem",
+        options={'HIDDEN'},
+        maxlen=255,  # Max internal buffer length, longer would be clamped.
+    )
+
+    # multi select in the file browser
+    files: CollectionProperty(
+        type=bpy.types.OperatorFileListElement,
+        options={'HIDDEN', 'SKIP_SAVE'},
+    )
+    directory: StringProperty(
+        subtype='DIR_PATH',
+        options={'HIDDEN', 'SKIP_SAVE'},
+    )
+
+    # List of operator properties, the attributes will be assigned
+    # to the class instance from the operator settings before calling.
+    setting_cleanup: BoolProperty(
+        name="clean whole scene (!)",
+        description="removes all objects and collections before import",
+        default=False,
+    )
+
+    lod_lvl: EnumProperty(
+        name="LOD Level",
+        description="select LOD level [1-10] with 1: highest poly; 10: lowest poly",
+        items=(
+            ('0', "1 (default)", "LOD level 1 (default)"),
+            ('1', "2", "LOD level 2"),
+            ('2', "3", "LOD level 3"),
+            ('3', "4", "LOD level 4"),
+            ('4', "5", "LOD level 5"),
+            ('5', "6", "LOD level 6"),
+            ('6', "7", "LOD level 7"),
+            ('7', "8", "LOD level 8"),
+            ('8', "9", "LOD level 9"),
+            ('9', "10", "LOD level 10"),
+            ('-1', "all", "all LOD levels, parsed once and imported into one collection per level"),
+        ),
+        default='0',
+    )
+
+    anim_mode: EnumProperty(
+        name="Animation",
+        description="how vertex animation of multi frame models is imported",
+        items=(
+            ('SHAPE_KEYS', "Shape Keys", "one shape key per frame (fast)"),
+            ('KEYFRAMES', "Vertex Keyframes", "one fcurve per vertex coordinate"),
+        ),
+        default='SHAPE_KEYS',
+    )
+
+    setting_cache: BoolProperty(
+        name="cache parsed files",
+        description="keeps decoded files on disk, so importing the same file again skips decoding",
+        default=False,
+    )
+
+    cache_dir: StringProperty(
+        name="cache directory",
+        description="where decoded files are kept, empty for the system temp directory",
+        subtype='DIR_PATH',
+        default="",
+    )
+
+    cache_size: IntProperty(
+        name="cache size (MB)",
+        description="least recently used files are removed once the cache grows beyond this",
+        min=16,
+        default=1024,
+    )
+
+    setting_background: BoolProperty(
+        name="import in background",
+        description="keeps Blender responsive during the import and shows its progress, ESC cancels",
+        default=True,
+    )
+
+    setting_timing: BoolProperty(
+        name="print timings",
+        description="prints the time spent in each import phase to the console",
+        default=False,
+    )
+
+    def getFilenames(self) -> list[str]:
+        if self.directory and any(x.name for x in self.files):
+            return [os.path.join(self.directory, x.name) for x in self.files if x.name]
+        return [self.filepath]
+
+    def execute(self, context):
+        print(self.filepath, self.setting_cleanup, self.lod_lvl, self.anim_mode)
+        filenames = self.getFilenames()
+
+        from .cem.timing import enableTiming
+        enableTiming(self.setting_timing)
+
+        if self.setting_cleanup:
+            print("cleaning up")
+            utils.cleanup()
+
+        cache = None
+        if self.setting_cache:
+            from .cem.cache import ParseCache, CACHE_DIR
+            cache = ParseCache(bpy.path.abspath(self.cache_dir) or CACHE_DIR, self.cache_size * 1024 * 1024)
+
+        # without a window there is no event loop to run a modal operator in
+        if self.setting_background and context.window is not None:
+            return self._startBackgroundImport(context, filenames, cache)
+
+        if len(filenames) == 1:
+            from .CEMimport import cemImport
+            cemImport(filenames[0], int(self.lod_lvl), self.anim_mode, cache)
+        else:
+            from .CEMimport import cemImportFiles
+            cemImportFiles(filenames, int(self.lod_lvl), self.anim_mode, cache)
+
+        return {'FINISHED'}
+
+    def _startBackgroundImport(self, context, filenames: list[str], cache):
+        from .CEMimport import startParsers, importFilesSteps
+
+        # parsing runs in threads, meshes are built on the main thread in time slices
+        self._parsers = startParsers(filenames, self.anim_mode, cache)
+        self._steps = importFilesSteps(self._parsers, int(self.lod_lvl), self.anim_mode)
+        self._label = os.path.basename(filenames[0]) if len(filenames) == 1 else f"{len(filenames)} files"
+        self._progress = 0.0
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(IMPORT_TIMER_STEP, window=context.window)
+        wm.progress_begin(0, 100)
+        wm.modal_handler_add(self)
+
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self._finishBackgroundImport(context)
+            self.report({'WARNING'}, "CEM import cancelled, objects imported so far are kept")
+            return {'CANCELLED'}
+
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        deadline = time.perf_counter() + IMPORT_TIME_SLICE
+
+        try:
+            while time.perf_counter() < deadline:
+                progress = next(self._steps)
+
+                # the next model is not parsed yet, hand control back until the next timer event
+                if progress is None:
+                    break
+                self._progress = progress
+        except StopIteration:
+            self._finishBackgroundImport(context)
+
+            from .cem.timing import logTotals
+            logTotals()
+            return {'FINISHED'}
+        except Exception as e:
+            self._finishBackgroundImport(context)
+            self.report({'ERROR'}, f"CEM import failed: {e}")
+            return {'CANCELLED'}
+
+        context.window_manager.progress_update(self._progress * 100)
+        context.workspace.status_text_set(f"importing {self._label}: {self._progress:.0%} (ESC to cancel)")
+
+        return {'RUNNING_MODAL'}
+
+    def _finishBackgroundImport(self, context):
+        for parser in self._parsers:
+            parser.cancel()
+        self._steps.close()
+
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+
+
+#class ExportCEM(bpy.types.Operator):
+class ExportCEM(bpy.types.Operator, ImportHelper):
+    """Export an Empire Earth (AoC) CEM file"""
+    bl_idname = "export_scene.cem"  # important since its how bpy.ops.import_test.some_data is constructed
+    bl_label = "Export CEM"
+
+    # ImportHelper mixin class uses this
+    filename_ext = ".cem"
+    check_extension = True
+    path_mode: path_reference_mode
+
+    filter_glob: StringProperty(
+        default="*.cem",
+        options={'HIDDEN'},
+        maxlen=255,  # Max internal buffer length, longer would be clamped.
+    )
+
+    lod_levels: IntProperty(
+        name="LOD levels",
+        description="number of LOD levels to write, levels 2 and up are generated by decimating LOD 1",
+        min=1, max=10,
+        default=1,
+    )
+
+    lod_ratio: FloatProperty(
+        name="LOD ratio",
+        description="share of faces each LOD level keeps from the level above",
+        min=0.05, max=0.95,
+        default=0.5,
+    )
+
+    setting_weld: BoolProperty(
+        name="weld vertices",
+        description="merges vertices which are identical in every frame and removes unused ones",
+        default=True,
+    )
+
+    setting_optimize_cache: BoolProperty(
+        name="optimize vertex cache",
+        description="reorders faces and vertices for faster rendering, prints the ACMR before and after to the console",
+        default=False,
+    )
+
+    setting_timing: BoolProperty(
+        name="print timings",
+        description="prints the time spent in each export phase to the console",
+        default=False,
+    )
+
+    def execute(self, context):
+        from .cem.timing import enableTiming
+        enableTiming(self.setting_timing)
+
+        from .CEMexport import cemExport
+        cemExport(self.filepath, lodLevels=self.lod_levels, lodRatio=self.lod_ratio, optimizeCache=self.setting_optimize_cache, weld=self.setting_weld)
+        return {'FINISHED'}
+
+
+class PrepareCemOperator(bpy.types.Operator):
+    bl_idname = "sequencer.collection_operator"
+    bl_label = "Create New CEM Structure"
+    bl_description = "Creates new CEM structure needed for exporting"
+
+    def add_cube_placeholder(self, name: str, collection: bpy.types.Collection):
+        tmp_obj = bpy.data.objects.new(name, None)
+        tmp_obj.empty_display_type = 'CUBE'
+
+        collection.objects.link(tmp_obj)
+
+    def add_empty_placeholder(self, name: str, collection: bpy.types.Collection):
+        tmp_obj = bpy.data.objects.new(name, None)
+        tmp_obj.empty_display_size = EMPTY_SIZE
+        tmp_obj.empty_display_type = 'PLAIN_AXES'
+
+        collection.objects.link(tmp_obj)
+
+    def execute(self, context):
+        print("creating fresh CEM structure")
+
+        currScene = bpy.context.scene
+
+        mainCol = bpy.data.collections.new("M:newUnit.cem.LOD 0")
+        currScene.collection.children.link(mainCol)
+
+        sceneRoot = bpy.data.collections.new("1:Scene Root")
+        mainCol.children.link(sceneRoot)
+
+        tagPoints = bpy.data.collections.new("tag points")
+        sceneRoot.children.link(tagPoints)
+
+        self.add_cube_placeholder(name="1:none-tmp:0", collection=sceneRoot)
+        self.add_cube_placeholder(name="2:player color-tmp:0", collection=sceneRoot)
+
+        self.add_empty_placeholder(name="attack", collection=tagPoints)
+        self.add_empty_placeholder(name="damage_trail_1", collection=tagPoints)
+        self.add_empty_placeholder(name="weapon_mount_1", collection=tagPoints)
+
+        return {'FINISHED'}
+
+class ErrorMessage(bpy.types.Operator):
+    bl_idname = 'ui.error_message'
+    bl_label = "Test error"
+    bl_description = "Some useless text"
+
+    def execute(self, context):
+        self.report({'INFO'}, message="ERROR: SOME STUPID  MESSAGE")
+        return {'CANCELLED'}
+
+
+# Only needed if you want to add into a dynamic menu
+def menu_func_import(self, context):
+    self.layout.operator(ImportCEM.bl_idname, text="Empire Earth (.cem)")
+
+def menu_func_export(self, context):
+    self.layout.operator(ExportCEM.bl_idname, text="Empire Earth (.cem)")
+
+def register():
+    bpy.utils.register_class(PrepareCemOperator)
+    bpy.utils.register_class(ImportCEM)
+    bpy.utils.register_class(ExportCEM)
+    bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
+    bpy.types.TOPBAR_MT_file_export.append(menu_func_export)
+
+    bpy.utils.register_class(ErrorMessage)
+
+def unregister():
+    bpy.utils.unregister_class(PrepareCemOperator)
+    bpy.utils.unregister_class(ImportCEM)
+    bpy.utils.unregister_class(ExportCEM)
+    bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
+    bpy.types.TOPBAR_MT_file_export.remove(menu_func_export)
+
+    bpy.utils.unregister_class(ErrorMessage)
+
@@ -1,49 +1,10 @@
-## data loading
-
-import struct
-from io import BufferedReader, BufferedWriter
-
-def readInt(f: BufferedReader) -> int:
-    return int.from_bytes(f.read(4), byteorder="little", signed=False)
-def readShort(f: BufferedReader) -> int:
-    return int.from_bytes(f.read(2), byteorder="little", signed=False)
-def readByte(f: BufferedReader) -> int:
-    return int.from_bytes(f.read(1), byteorder="little", signed=False)
-def readFloat(f: BufferedReader) -> float:
-    return struct.unpack("<f", f.read(4))[0]
-
-def readString(f: BufferedReader) -> str:
-    length = readInt(f)
-    return f.read(length).strip(b"\0").decode("iso8859-15")
-
-def writeInt(f: BufferedWriter, value: int) -> int:
-    return f.write(value.to_bytes(4, byteorder="little", signed=False))
-def writeShort(f: BufferedWriter, value: int) -> int:
-    return f.write(value.to_bytes(2, byteorder="little", signed=False))
-def writeByte(f: BufferedWriter, value: int) -> int:
-    return f.write(value.to_bytes(1, byteorder="little", signed=False))
-def writeFloat(f: BufferedWriter, value: float) -> int:
-    return f.write(struct.pack("<f", value))
-
-def writeString(f: BufferedWriter, value: str) -> int:
-    value = value.encode("iso8859-15")
-    value = checkNullTerminator(value)
-
-    writeInt(f, len(value))
-    return f.write(value)
-
-
-def checkNullTerminator(data: bytes) -> bytes:
-    if not data.endswith(b"\0"):
-        data += b"\0"
-    return data
-
-
 # Blender helpers
 
 import bpy
 from mathutils import Vector, Matrix
 
+EMPTY_SIZE = 0.04
+
 def newEmpty(name: str, size: float) -> bpy.types.Object:
     empty = bpy.data.objects.new(name, None)
     empty.empty_display_size = size
@@ -57,6 +18,35 @@ def newEmptyCube(name: str) -> bpy.types.Object:
     return cube
 
 
+def setKeyframes(idBlock: bpy.types.ID, dataPath: str, frames, values):
+    """
+    writes keyframes for all frames at once instead of calling keyframe_insert per frame,
+    values contains one row per frame and one column per property index
+    """
+    import numpy as np
+
+    if idBlock.animation_data is None:
+        idBlock.animation_data_create()
+    if idBlock.animation_data.action is None:
+        idBlock.animation_data.action = bpy.data.actions.new(f"{idBlock.name}Action")
+
+    fcurves = idBlock.animation_data.action.fcurves
+
+    frames = np.asarray(frames, dtype=np.float32)
+    values = np.asarray(values, dtype=np.float32).reshape(len(frames), -1)
+
+    points = np.empty((len(frames), 2), dtype=np.float32)
+    points[:, 0] = frames
+
+    for index in range(values.shape[1]):
+        points[:, 1] = values[:, index]
+
+        fcurve = fcurves.find(dataPath, index=index) or fcurves.new(dataPath, index=index)
+        fcurve.keyframe_points.add(len(frames))
+        fcurve.keyframe_points.foreach_set("co", points.ravel())
+        fcurve.update()
+
+
 def redraw():
     for area in bpy.context.screen.areas:
         if area.type in ['IMAGE_EDITOR', 'VIEW_3D']:
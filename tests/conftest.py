@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the format code is imported from the repository, without installing the addon
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,71 @@
+import io
+import os
+
+from blender_addon.cem import ParseCache, parseCached, serializeModels, createCEM
+from blender_addon.cem.synthetic import generateModels
+
+
+def writeModel(filename, seed: int = 0) -> bytes:
+    models = generateModels(vertices=100, frames=3, childModels=1, tagPoints=2, seed=seed)
+    with createCEM(filename) as f:
+        serializeModels(f, models)
+
+    with open(filename, "rb") as f:
+        return f.read()
+
+def serialize(models) -> bytes:
+    f = io.BytesIO()
+    serializeModels(f, models)
+    return f.getvalue()
+
+
+def test_cache_round_trip(tmp_path):
+    filename = tmp_path / "model.cem"
+    data = writeModel(filename)
+    cache = ParseCache(str(tmp_path / "cache"))
+
+    # cold and warm parse
+    assert serialize(parseCached(str(filename), cache)) == data
+    assert serialize(parseCached(str(filename), cache)) == data
+    assert len(os.listdir(cache.directory)) == 1
+
+def test_evict(tmp_path):
+    cache = ParseCache(str(tmp_path / "cache"))
+
+    for i in range(3):
+        filename = tmp_path / f"model_{i}.cem"
+        writeModel(filename, seed=i)
+        parseCached(str(filename), cache)
+
+    cache.maxBytes = 1
+    cache.evict()
+    assert os.listdir(cache.directory) == []
+
+def test_load_evicted_entry(tmp_path, monkeypatch):
+    filename = tmp_path / "model.cem"
+    writeModel(filename)
+    cache = ParseCache(str(tmp_path / "cache"))
+    parseCached(str(filename), cache)
+
+    # another thread evicts the entry between loading and touching it
+    def utime(path, *args):
+        raise FileNotFoundError(path)
+    monkeypatch.setattr(os, "utime", utime)
+
+    assert cache.load(str(filename)) is not None
+
+def test_hash_once(tmp_path, monkeypatch):
+    filename = tmp_path / "model.cem"
+    writeModel(filename)
+    cache = ParseCache(str(tmp_path / "cache"))
+
+    keys = list()
+    key = ParseCache.key
+    monkeypatch.setattr(ParseCache, "key", lambda self, x: keys.append(x) or key(self, x))
+
+    # cold and warm import
+    parseCached(str(filename), cache)
+    assert len(keys) == 1
+
+    parseCached(str(filename), cache)
+    assert len(keys) == 2
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from blender_addon.cem import Catalog, serializeModels, createCEM
+from blender_addon.cem.synthetic import generateModels
+
+
+def writeModel(path, compressed: bool = False, **kwargs):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    models = generateModels(vertices=50, frames=2, tagPoints=2, **kwargs)
+    with createCEM(path, compressed) as f:
+        serializeModels(f, models)
+
+    return models
+
+def touch(path):
+    """moves the mtime forward, coarse file system timestamps might not see the rewrite otherwise"""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+@pytest.fixture
+def models(tmp_path):
+    root = tmp_path / "models"
+    writeModel(str(root / "a.cem"), childModels=2)
+    writeModel(str(root / "sub" / "b.cem"), compressed=True, materials=2)
+    (root / "notes.txt").write_text("not a model")
+
+    return str(root)
+
+@pytest.fixture
+def catalog(tmp_path):
+    with Catalog(str(tmp_path / "cem.db")) as catalog:
+        yield catalog
+
+
+def test_update(models, catalog):
+    assert catalog.update([models]) == dict(added=2, updated=0, unchanged=0, removed=0, failed=0)
+
+    a = os.path.join(models, "a.cem")
+    b = os.path.join(models, "sub", "b.cem")
+
+    # every model of a file has the tag points
+    assert catalog.modelsWithTagPoint("TAG POINT 1") == [
+        (a, 0, "Scene Root"), (a, 1, "child 1"), (a, 2, "child 2"), (b, 0, "Scene Root")
+    ]
+    assert catalog.modelsWithTexture("texture_1.tga") == [(b, 0, "Scene Root")]
+    assert dict(catalog.textures()) == {"texture_0.tga": 4, "texture_1.tga": 1}
+    assert catalog.failedFiles() == []
+
+def test_update_unchanged(models, catalog):
+    catalog.update([models])
+
+    assert catalog.update([models]) == dict(added=0, updated=0, unchanged=2, removed=0, failed=0)
+    assert len(catalog.modelsWithTagPoint("tag point 0")) == 4
+
+def test_update_changed(models, catalog):
+    catalog.update([models])
+
+    a = os.path.join(models, "a.cem")
+    writeModel(a, childModels=0, materials=3)
+    touch(a)
+
+    assert catalog.update([models]) == dict(added=0, updated=1, unchanged=1, removed=0, failed=0)
+
+    # the models of the old version are gone
+    assert catalog.modelsWithTagPoint("tag point 0") == [(a, 0, "Scene Root"), (os.path.join(models, "sub", "b.cem"), 0, "Scene Root")]
+    assert catalog.modelsWithTexture("texture_2.tga") == [(a, 0, "Scene Root")]
+
+def test_update_removed(models, catalog, tmp_path):
+    other = str(tmp_path / "other" / "c.cem")
+    writeModel(other)
+
+    catalog.update([models, other])
+    os.remove(os.path.join(models, "sub", "b.cem"))
+
+    # only files below the scanned paths are removed
+    assert catalog.update([models]) == dict(added=0, updated=0, unchanged=1, removed=1, failed=0)
+    assert [x[0] for x in catalog.modelsWithTexture("texture_0.tga")] == [os.path.join(models, "a.cem")] * 3 + [other]
+    assert catalog.modelsWithTexture("texture_1.tga") == []
+
+def test_update_failed(models, catalog):
+    broken = os.path.join(models, "broken.cem")
+    with open(broken, "wb") as f:
+        f.write(b"SSMF\x02\x00\x00\x00")
+
+    assert catalog.update([models])["failed"] == 1
+
+    # the error is stored with the file
+    [(path, error)] = catalog.failedFiles()
+    assert path == broken
+    assert error.startswith("error: ")
+
+    # failed files are not read again until they change
+    assert catalog.update([models]) == dict(added=0, updated=0, unchanged=3, removed=0, failed=0)
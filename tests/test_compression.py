@@ -0,0 +1,74 @@
+import io
+import struct
+import zlib
+
+import pytest
+
+from blender_addon.cem import CEMReader, parseModels, serializeModels, openCEM, createCEM, validateFile
+from blender_addon.cem.synthetic import generateModels
+
+# no compressed file of the game is available yet, the samples below are
+# built by hand following the assumed layout: magic, uint32 size, zlib data
+
+
+@pytest.fixture
+def data() -> bytes:
+    f = io.BytesIO()
+    serializeModels(f, generateModels(vertices=300, frames=3, lodLevels=2, childModels=2, tagPoints=2, materials=2))
+    return f.getvalue()
+
+
+def serialize(models) -> bytes:
+    f = io.BytesIO()
+    serializeModels(f, models)
+    return f.getvalue()
+
+def pk01(data: bytes, size: int = None) -> bytes:
+    return b"PK01" + struct.pack("<I", len(data) if size is None else size) + zlib.compress(data)
+
+
+def test_read_sample(data, tmp_path):
+    filename = tmp_path / "sample.cem"
+    filename.write_bytes(pk01(data))
+
+    with openCEM(filename) as f:
+        assert serialize(parseModels(f)) == data
+
+    with CEMReader(filename) as reader:
+        assert serialize(reader.models) == data
+
+    assert validateFile(filename) == []
+
+def test_write_layout(data, tmp_path):
+    filename = tmp_path / "written.cem"
+    with createCEM(filename, compressed=True) as f:
+        f.write(data)
+
+    written = filename.read_bytes()
+
+    assert written[:4] == b"PK01"
+    assert struct.unpack_from("<I", written, 4)[0] == len(data)
+    assert zlib.decompress(written[8:]) == data
+
+def test_not_zlib(data, tmp_path):
+    filename = tmp_path / "other.cem"
+    filename.write_bytes(b"PK01" + struct.pack("<I", len(data)) + data)
+
+    with openCEM(filename) as f, pytest.raises(ValueError, match="assumed layout"):
+        parseModels(f)
+
+    with pytest.raises(ValueError, match="assumed layout"):
+        CEMReader(filename)
+
+    issues = validateFile(filename)
+    assert len(issues) == 1
+    assert "assumed layout" in issues[0].message
+
+def test_wrong_size(data, tmp_path):
+    filename = tmp_path / "size.cem"
+    filename.write_bytes(pk01(data, len(data) + 10))
+
+    with openCEM(filename) as f, pytest.raises(ValueError, match="header says"):
+        f.read()
+
+    assert "header says" in validateFile(filename)[0].message
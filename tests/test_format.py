@@ -0,0 +1,84 @@
+import io
+
+import numpy as np
+import pytest
+
+from blender_addon.cem import (
+    CEM_MAGIC,
+    CEMReader,
+    Face,
+    parseModels,
+    serializeModels,
+    openCEM,
+    createCEM,
+)
+from blender_addon.cem.binary import writeInt, writeFloat, writeString
+from blender_addon.cem.synthetic import generateModel, generateModels
+
+SIZES = [
+    dict(vertices=10, frames=1, lodLevels=1, tagPoints=0, materials=1),
+    dict(vertices=300, frames=4, lodLevels=3, tagPoints=3, materials=3),
+    dict(vertices=1000, frames=2, lodLevels=2, tagPoints=1, materials=5),
+]
+
+
+def serializeRecords(cem) -> bytes:
+    """the model written one record at a time, like the writer did before toBytes"""
+    f = io.BytesIO()
+    f.write(CEM_MAGIC)
+    cem.header.serialize(f)
+
+    for faces in cem.faces:
+        writeInt(f, len(faces))
+        for face in np.asarray(faces).tolist():
+            Face(*face).serialize(f)
+
+    for material in cem.materials:
+        material.serialize(f)
+
+    for tagPoint in cem.tagPoints:
+        writeString(f, tagPoint)
+
+    for frame in cem.frames:
+        writeFloat(f, frame.radius)
+        for vertex in frame.vertices:
+            vertex.serialize(f)
+        for tagPoint in frame.tagPoints:
+            tagPoint.serialize(f)
+        frame.transformationMatrix.serialize(f)
+        frame.lowerBound.serialize(f)
+        frame.upperBound.serialize(f)
+
+    return f.getvalue()
+
+def serialize(models) -> bytes:
+    f = io.BytesIO()
+    serializeModels(f, models)
+    return f.getvalue()
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_to_bytes_matches_records(size):
+    cem = generateModel(**size)
+    assert bytes(cem.toBytes()) == serializeRecords(cem)
+
+@pytest.mark.parametrize("size", SIZES)
+def test_round_trip(size):
+    data = serialize(generateModels(childModels=2, **size))
+    assert serialize(parseModels(io.BytesIO(data))) == data
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_file_round_trip(tmp_path, compressed):
+    models = generateModels(childModels=2, **SIZES[1])
+    data = serialize(models)
+    filename = tmp_path / "model.cem"
+
+    with createCEM(filename, compressed) as f:
+        serializeModels(f, models)
+
+    with openCEM(filename) as f:
+        assert serialize(parseModels(f)) == data
+        assert f.read() == b""
+
+    with CEMReader(filename) as reader:
+        assert serialize(reader.models) == data
@@ -0,0 +1,107 @@
+import io
+
+import pytest
+
+from blender_addon.cem import (
+    parseModels,
+    serializeModels,
+    openCEM,
+    createCEM,
+    indexChildModels,
+    scanFile,
+    readChildModel,
+    replaceChildModel,
+)
+from blender_addon.cem.synthetic import generateModel, generateModels
+
+
+@pytest.fixture
+def data() -> bytes:
+    f = io.BytesIO()
+    serializeModels(f, generateModels(vertices=200, frames=3, lodLevels=2, childModels=3, tagPoints=2, materials=2))
+    return f.getvalue()
+
+
+def writeFile(path, data: bytes, compressed: bool):
+    with createCEM(path, compressed) as f:
+        f.write(data)
+
+def replace(data: bytes, index: int, cem) -> bytes:
+    src = io.BytesIO(data)
+    dst = io.BytesIO()
+    replaceChildModel(src, dst, indexChildModels(src), index, cem)
+    return dst.getvalue()
+
+
+def test_index_matches_parse(data):
+    models = parseModels(io.BytesIO(data))
+    entries = indexChildModels(io.BytesIO(data))
+
+    assert [x.index for x in entries] == list(range(len(models)))
+    assert entries[0].offset == 0
+    assert entries[-1].offset + entries[-1].size == len(data)
+
+    for entry, cem in zip(entries, models):
+        assert entry.name == cem.header.name
+        assert entry.header == cem.header
+        assert data[entry.offset : entry.offset + entry.size] == bytes(cem.toBytes())
+
+        # without tables only the header is read
+        assert entry.materials == [] and entry.tagPoints == []
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_scan_file(data, tmp_path, compressed):
+    filename = tmp_path / "model.cem"
+    writeFile(filename, data, compressed)
+
+    models = parseModels(io.BytesIO(data))
+    entries = scanFile(filename)
+
+    assert len(entries) == len(models)
+
+    for entry, cem in zip(entries, models):
+        assert entry.header == cem.header
+        assert entry.materials == cem.materials
+        assert entry.tagPoints == cem.tagPoints
+
+    # offsets of compressed files refer to the decompressed data
+    with openCEM(filename) as f:
+        assert [(x.offset, x.size) for x in indexChildModels(f)] == [(x.offset, x.size) for x in entries]
+
+    assert [(x.offset, x.size) for x in entries] == [(x.offset, x.size) for x in indexChildModels(io.BytesIO(data))]
+
+def test_read_child_model(data):
+    f = io.BytesIO(data)
+    entries = indexChildModels(f)
+    models = parseModels(io.BytesIO(data))
+
+    for entry in reversed(entries):
+        assert bytes(readChildModel(f, entry).toBytes()) == bytes(models[entry.index].toBytes())
+
+def test_replace_with_itself(data):
+    f = io.BytesIO(data)
+    entries = indexChildModels(f)
+
+    for entry in entries:
+        assert replace(data, entry.index, readChildModel(f, entry)) == data
+
+def test_replace_child(data):
+    models = parseModels(io.BytesIO(data))
+    replacement = generateModel(vertices=50, frames=3, name="replacement", seed=7)
+
+    result = parseModels(io.BytesIO(replace(data, 2, replacement)))
+
+    assert [x.header.name for x in result] == [x.header.name for x in models[:2]] + ["replacement"] + [x.header.name for x in models[3:]]
+    assert bytes(result[2].toBytes()) == bytes(replacement.toBytes())
+    assert bytes(result[3].toBytes()) == bytes(models[3].toBytes())
+
+def test_replace_main_model(data):
+    models = parseModels(io.BytesIO(data))
+    replacement = generateModel(vertices=50, frames=3, name="new root", seed=7)
+    assert replacement.header.childModels == 0
+
+    result = parseModels(io.BytesIO(replace(data, 0, replacement)))
+
+    assert result[0].header.name == "new root"
+    assert result[0].header.childModels == models[0].header.childModels
+    assert [bytes(x.toBytes()) for x in result[1:]] == [bytes(x.toBytes()) for x in models[1:]]
@@ -0,0 +1,204 @@
+import io
+
+import numpy as np
+import pytest
+
+from blender_addon.cem import CEMv2, Header, Material, validateBuffer
+from blender_addon.cem.meshopt import acmr, modelAcmr, optimizeModelCache, weldVertices, calcFrameBounds, decimate, generateLODs
+from blender_addon.cem.synthetic import generateModel
+
+
+def sphere(rings: int = 12, segments: int = 16) -> tuple[np.ndarray, np.ndarray]:
+    """closed UV sphere around the origin, faces point outwards"""
+    theta = np.linspace(0, np.pi, rings + 1)[1:-1]
+    phi = np.linspace(0, 2 * np.pi, segments, endpoint=False)
+    t, p = np.meshgrid(theta, phi, indexing="ij")
+
+    ring = np.stack([np.sin(t) * np.cos(p), np.sin(t) * np.sin(p), np.cos(t)], axis=2).reshape(-1, 3)
+    points = np.concatenate([[[0, 0, 1]], ring, [[0, 0, -1]]])
+    bottom = len(points) - 1
+
+    def vertex(i: int, j: int) -> int:
+        return 1 + i * segments + j % segments
+
+    faces = list()
+    for j in range(segments):
+        faces.append((0, vertex(0, j), vertex(0, j + 1)))
+        faces.append((bottom, vertex(rings - 2, j + 1), vertex(rings - 2, j)))
+
+    for i in range(rings - 2):
+        for j in range(segments):
+            faces.append((vertex(i, j), vertex(i + 1, j), vertex(i + 1, j + 1)))
+            faces.append((vertex(i, j), vertex(i + 1, j + 1), vertex(i, j + 1)))
+
+    return points, np.array(faces)
+
+def outwards(points: np.ndarray, faces: np.ndarray) -> bool:
+    """true if every face of a convex mesh around the origin points away from it"""
+    p0, p1, p2 = (points[faces[:, i]] for i in range(3))
+    normals = np.cross(p1 - p0, p2 - p0)
+
+    return bool(np.all(np.einsum("ij,ij->i", normals, p0 + p1 + p2) > 0))
+
+def sphereModel(materials: int = 2, frames: int = 2) -> CEMv2:
+    """one sphere per material, every frame scales them"""
+    points, faces = sphere()
+
+    cem = generateModel(vertices=materials * len(points), frames=frames, materials=materials)
+    cem.faces = [np.concatenate([faces] * materials).astype(np.uint32)]
+    cem.header.faces = len(cem.faces[0])
+
+    for m, material in enumerate(cem.materials):
+        material.triangleSelections = [(m * len(faces), len(faces))]
+
+    for i, frame in enumerate(cem.frames):
+        frame.vertexData[:, 0:3] = np.concatenate([points * (m + 1 + i) for m in range(materials)])
+
+    calcFrameBounds(cem)
+    return cem
+
+def triangleData(cem: CEMv2) -> list:
+    """sorted vertex data of every triangle, per LOD level, material and frame"""
+    result = list()
+
+    for level in range(cem.header.lodLevels):
+        for material in cem.materials:
+            offset, count = material.triangleSelections[level]
+            faces = np.asarray(cem.faces[level][offset : offset + count], dtype=np.int64) + material.vertexOffset
+
+            for frame in cem.frames:
+                triangles = frame.vertexData[faces].reshape(len(faces), -1)
+                result.append(sorted(x.tobytes() for x in triangles))
+
+    return result
+
+
+def test_acmr_per_material():
+    # the same local indices in two materials are different vertices
+    cem = CEMv2(
+        header=Header(faces=2, vertices=6, materials=2),
+        faces=[np.array([[0, 1, 2], [0, 1, 2]], dtype=np.uint32)],
+        materials=[
+            Material("a", 0, [(0, 1)], 0, 3, ""),
+            Material("b", 1, [(1, 1)], 3, 3, ""),
+        ],
+        frames=list(),
+        tagPoints=list()
+    )
+
+    assert acmr(cem.faces[0]) == 1.5
+    assert modelAcmr(cem) == 3.0
+
+def test_vertex_cache_keeps_triangles():
+    cem = generateModel(vertices=1000, frames=2, lodLevels=2, tagPoints=1, materials=5)
+
+    before = triangleData(cem)
+    acmrBefore, acmrAfter = optimizeModelCache(cem)
+
+    assert acmrAfter < acmrBefore
+    assert triangleData(cem) == before
+    assert validateBuffer(cem.toBytes()) == []
+
+def test_weld_keeps_triangles():
+    cem = generateModel(vertices=300, frames=4, lodLevels=3, tagPoints=3, materials=3)
+
+    # duplicate the first vertex of every material into its last slot
+    for frame in cem.frames:
+        for material in cem.materials:
+            frame.vertexData[material.vertexOffset + material.vertexCount - 1] = frame.vertexData[material.vertexOffset]
+
+    before = triangleData(cem)
+    numVertices, weldedVertices = weldVertices(cem)
+
+    assert weldedVertices < numVertices
+    assert triangleData(cem) == before
+    assert sum(x.vertexCount for x in cem.materials) == cem.header.vertices == weldedVertices
+    assert validateBuffer(cem.toBytes()) == []
+
+def test_decimate_targets():
+    points, faces = sphere()
+    targets = [len(faces) // 2, len(faces) // 4, len(faces) // 8]
+
+    levels = decimate(points, faces, targets)
+
+    assert len(levels) == len(targets)
+    for target, levelFaces in zip(targets, levels):
+        # a collapse on a closed mesh removes two faces
+        assert target - 1 <= len(levelFaces) <= target
+        assert levelFaces.max() < len(points)
+        assert outwards(points, levelFaces)
+
+def test_decimate_empty():
+    levels = decimate(np.zeros((0, 3)), np.zeros((0, 3), dtype=np.uint32), [10, 5])
+
+    assert [x.shape for x in levels] == [(0, 3), (0, 3)]
+
+@pytest.mark.parametrize("ratio", [0.5, 0.3])
+def test_generate_lods(ratio):
+    cem = sphereModel()
+    lod1 = cem.faces[0].copy()
+    points = cem.frames[0].vertexData[:, 0:3]
+
+    generateLODs(cem, 3, ratio)
+
+    assert cem.header.lodLevels == len(cem.faces) == 3
+    assert np.array_equal(cem.faces[0], lod1)
+
+    for level, lodFaces in enumerate(cem.faces):
+        first = 0
+
+        for material in cem.materials:
+            offset, count = material.triangleSelections[level]
+            target = int(round(material.triangleSelections[0][1] * ratio ** level))
+
+            # the materials' faces follow each other without gaps
+            assert offset == first
+            first += count
+
+            assert target - 1 <= count <= target
+
+            faces = lodFaces[offset : offset + count]
+            assert faces.max() < material.vertexCount
+            assert outwards(points, faces.astype(np.int64) + material.vertexOffset)
+
+        assert first == len(lodFaces)
+
+    assert validateBuffer(cem.toBytes()) == []
+
+def test_frame_bounds():
+    cem = generateModel(vertices=500, frames=3)
+    # frames 1 and 2 share one vertex block
+    cem.frames[2].vertexData = cem.frames[1].vertexData
+    cem.frames[0].vertexData[:, 0:3] += (10, -5, 3)
+
+    calcFrameBounds(cem)
+
+    assert (cem.frames[1].lowerBound, cem.frames[1].upperBound, cem.frames[1].radius) == \
+           (cem.frames[2].lowerBound, cem.frames[2].upperBound, cem.frames[2].radius)
+    assert cem.frames[0].lowerBound != cem.frames[1].lowerBound
+
+    # checked on the float32 values written to the file
+    for frame in CEMv2.parse(io.BytesIO(cem.toBytes())).frames:
+        points = frame.points.astype(np.float64)
+        lower, upper = np.array(frame.lowerBound.toTuple()), np.array(frame.upperBound.toTuple())
+
+        assert np.allclose(lower, points.min(axis=0))
+        assert np.allclose(upper, points.max(axis=0))
+
+        # the radius is around the center of the bounds
+        distances = np.linalg.norm(points - (lower + upper) / 2, axis=1)
+        assert np.all(distances <= frame.radius)
+        assert np.isclose(distances.max(), frame.radius)
+
+def test_frame_bounds_without_vertices():
+    cem = generateModel(vertices=10, frames=2)
+    cem.header.vertices = 0
+    for frame in cem.frames:
+        frame.vertexData = frame.vertexData[:0]
+        frame.radius = 1.0
+
+    calcFrameBounds(cem)
+
+    for frame in cem.frames:
+        assert frame.radius == 0.0
+        assert frame.lowerBound.toTuple() == frame.upperBound.toTuple() == (0, 0, 0)
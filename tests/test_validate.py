@@ -0,0 +1,72 @@
+import io
+import json
+import struct
+
+import pytest
+
+from blender_addon.cem import serializeModels, createCEM, validateBuffer, validateFile
+from blender_addon.cem.synthetic import generateModels
+
+
+@pytest.fixture
+def data() -> bytes:
+    f = io.BytesIO()
+    serializeModels(f, generateModels(vertices=200, frames=3, lodLevels=2, childModels=2, tagPoints=2, materials=2))
+    return f.getvalue()
+
+
+def firstFaceOffset(data: bytes) -> int:
+    """offset of the first face index of LOD 1 in the main model"""
+    nameLength, = struct.unpack_from("<I", data, 4 + 4 + 7 * 4)
+    return 4 + 4 + 7 * 4 + 4 + nameLength + 12 + 4
+
+
+def test_valid(data, tmp_path):
+    assert validateBuffer(data) == []
+
+    for compressed in (False, True):
+        filename = tmp_path / f"model_{compressed}.cem"
+        with createCEM(filename, compressed) as f:
+            f.write(data)
+
+        assert validateFile(filename) == []
+
+def test_bad_face_index(data, tmp_path):
+    data = bytearray(data)
+    offset = firstFaceOffset(data) + 4
+    struct.pack_into("<I", data, offset, 999999)
+
+    issues = validateBuffer(data)
+
+    assert len(issues) == 1
+    assert issues[0].offset == offset
+    assert issues[0].model == 0
+    assert type(issues[0].offset) is int
+    assert "999999" in issues[0].message
+
+    # the cli writes the issues into a JSON report
+    json.dumps([vars(x) for x in issues])
+
+    filename = tmp_path / "bad.cem"
+    filename.write_bytes(data)
+    assert validateFile(filename) == issues
+
+def test_truncated(data):
+    issues = validateBuffer(data[: len(data) - 100])
+
+    assert len(issues) == 1
+    assert issues[0].model == 2
+    assert "needs" in issues[0].message
+
+def test_trailing_bytes(data):
+    issues = validateBuffer(data + b"\0" * 7)
+
+    assert len(issues) == 1
+    assert issues[0].offset == len(data)
+    assert "7 trailing bytes" in issues[0].message
+
+def test_empty_file(tmp_path):
+    filename = tmp_path / "empty.cem"
+    filename.write_bytes(b"")
+
+    assert [x.offset for x in validateFile(filename)] == [0]